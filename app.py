@@ -5,6 +5,8 @@ from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 import logging
 import json
+import click
+from replica import RoutingSession, init_replica
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -12,7 +14,7 @@ logging.basicConfig(level=logging.DEBUG)
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={'class_': RoutingSession})
 
 # create the app
 app = Flask(__name__)
@@ -26,6 +28,8 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_pre_ping": True,
 }
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+# Optional read replica for read-only views (DATABASE_REPLICA_URL)
+init_replica(app)
 
 # initialize the app with the extension
 db.init_app(app)
@@ -44,5 +48,27 @@ def from_json_filter(value):
 with app.app_context():
     # Make sure to import the models here or their tables won't be created
     import models  # noqa: F401
-    db.create_all()
-    logging.info("Database tables created")
+    from migrations import STARTUP_MIGRATION, pending_migrations, run_migrations
+    applied = run_migrations(through=STARTUP_MIGRATION)
+    logging.info(f"Applied startup migrations: {applied or 'none'}")
+    pending = [version for version, _, _ in pending_migrations(db.engine)]
+    if pending:
+        logging.warning(f"Schema migrations {pending} are pending; run `flask migrate` to apply them")
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Apply pending schema migrations"""
+    from migrations import MIGRATIONS, applied_versions, run_migrations
+    applied = run_migrations()
+    done = applied_versions(db.engine)
+    for version, description, _ in MIGRATIONS:
+        state = 'applied now' if version in applied else 'applied' if version in done else 'pending'
+        print(f"{version:>4}  {description}  [{state}]")
+
+@app.cli.command('warm-place-cache')
+@click.option('--limit', default=200, show_default=True, help='Most frequent ride addresses to warm')
+def warm_place_cache_command(limit):
+    """Cache place details for the most frequent pickup and dropoff addresses"""
+    from services.location_service import LocationService
+    warmed = LocationService.warm_place_details_cache(limit)
+    print(f"Cached place details for {warmed} new places")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark the scalar haversine loop against the batched NumPy kernels.
+
+Usage: python benchmarks/bench_haversine.py [--repeat N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.geo import haversine_km, haversine_km_batch, haversine_km_matrix  # noqa: E402
+
+SIZES = [1_000, 10_000, 100_000]
+PICKUP = (40.7505, -73.9934)  # Midtown Manhattan
+
+
+def best_of(repeat, fn):
+    """Best wall-clock time of `repeat` runs, in seconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    print(f"{'drivers':>8}  {'scalar loop':>12}  {'batch':>10}  {'speedup':>8}")
+    for n in SIZES:
+        lats = [PICKUP[0] + rng.uniform(-0.3, 0.3) for _ in range(n)]
+        lngs = [PICKUP[1] + rng.uniform(-0.3, 0.3) for _ in range(n)]
+
+        scalar = best_of(args.repeat, lambda: [
+            haversine_km(PICKUP[0], PICKUP[1], lat, lng) for lat, lng in zip(lats, lngs)
+        ])
+        batch = best_of(args.repeat, lambda: haversine_km_batch(PICKUP[0], PICKUP[1], lats, lngs))
+
+        expected = [haversine_km(PICKUP[0], PICKUP[1], lat, lng) for lat, lng in zip(lats, lngs)]
+        got = haversine_km_batch(PICKUP[0], PICKUP[1], lats, lngs)
+        assert max(abs(a - b) for a, b in zip(expected, got)) < 1e-9
+
+        print(f"{n:>8}  {scalar * 1000:>10.2f}ms  {batch * 1000:>8.2f}ms  {scalar / batch:>7.1f}x")
+
+    # Pending pickups x available drivers, as used by batch dispatch
+    rides, drivers = 100, 1_000
+    ride_lats = [PICKUP[0] + rng.uniform(-0.3, 0.3) for _ in range(rides)]
+    ride_lngs = [PICKUP[1] + rng.uniform(-0.3, 0.3) for _ in range(rides)]
+    scalar = best_of(args.repeat, lambda: [
+        [haversine_km(rlat, rlng, lat, lng) for lat, lng in zip(lats[:drivers], lngs[:drivers])]
+        for rlat, rlng in zip(ride_lats, ride_lngs)
+    ])
+    matrix = best_of(args.repeat, lambda: haversine_km_matrix(ride_lats, ride_lngs, lats[:drivers], lngs[:drivers]))
+    print(f"\n{rides}x{drivers} matrix: scalar {scalar * 1000:.2f}ms, "
+          f"batch {matrix * 1000:.2f}ms, {scalar / matrix:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
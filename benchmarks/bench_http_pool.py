@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Measure connection reuse and failure handling of the pooled Google Maps client
+against a local stub server.
+
+Usage: python benchmarks/bench_http_pool.py [--calls N] [--latency-ms MS]
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.http_client import CircuitOpenError, PooledHTTPClient  # noqa: E402
+
+
+class StubMapsHandler(BaseHTTPRequestHandler):
+    """Answers every GET like the Geocoding API; /fail answers 503"""
+
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    connections = 0
+    requests_served = 0
+    latency = 0.0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes; without this, Nagle plus
+        # delayed ACKs add ~40ms to every keep-alive response
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with StubMapsHandler.lock:
+            StubMapsHandler.connections += 1
+
+    def do_GET(self):
+        with StubMapsHandler.lock:
+            StubMapsHandler.requests_served += 1
+        time.sleep(self.latency)
+        if self.path.startswith('/fail'):
+            body, status = b'{}', 503
+        else:
+            body = json.dumps({
+                'status': 'OK',
+                'results': [{'geometry': {'location': {'lat': 40.75, 'lng': -73.99}},
+                             'formatted_address': 'Stub', 'place_id': 'stub'}]
+            }).encode()
+            status = 200
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def reset_counters():
+    StubMapsHandler.connections = 0
+    StubMapsHandler.requests_served = 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    StubMapsHandler.latency = args.latency_ms / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubMapsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    reset_counters()
+    start = time.perf_counter()
+    for _ in range(args.calls):
+        response = requests.get(f"{base}/geocode", params={'address': 'x'}, timeout=10)
+        response.raise_for_status()
+        response.json()
+    bare = time.perf_counter() - start
+    bare_connections = StubMapsHandler.connections
+
+    client = PooledHTTPClient(max_retries=0)
+    reset_counters()
+    start = time.perf_counter()
+    for _ in range(args.calls):
+        client.get_json('geocode', f"{base}/geocode", {'address': 'x'})
+    pooled = time.perf_counter() - start
+    pooled_connections = StubMapsHandler.connections
+
+    print(f"{'client':>10}  {'calls':>6}  {'connections':>11}  {'total':>9}  {'per call':>9}")
+    print(f"{'bare':>10}  {args.calls:>6}  {bare_connections:>11}  {bare * 1000:>7.1f}ms  {bare / args.calls * 1000:>7.2f}ms")
+    print(f"{'pooled':>10}  {args.calls:>6}  {pooled_connections:>11}  {pooled * 1000:>7.1f}ms  {pooled / args.calls * 1000:>7.2f}ms")
+
+    # Circuit breaker: after the failure threshold, calls fail without touching the network
+    client = PooledHTTPClient(max_retries=1, backoff_base=0.01, failure_threshold=3, reset_timeout=60)
+    reset_counters()
+    outcomes = []
+    for _ in range(10):
+        start = time.perf_counter()
+        try:
+            client.get_json('geocode', f"{base}/fail", {})
+            outcomes.append('ok')
+        except CircuitOpenError:
+            outcomes.append(f"open {(time.perf_counter() - start) * 1e6:.0f}us")
+        except Exception:
+            outcomes.append('error')
+    print(f"\nfailing endpoint, 10 calls: {StubMapsHandler.requests_served} reached the server")
+    print(', '.join(outcomes))
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
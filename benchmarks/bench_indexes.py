@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Record query plans and timings of the ride, payment and driver lookup paths
+before and after the migration 2 indexes, on a large synthetic rides table.
+
+The tables are filled with INSERT ... SELECT in the database itself, so
+10M rides take minutes rather than hours. Plans come from EXPLAIN ANALYZE
+on PostgreSQL and EXPLAIN QUERY PLAN on SQLite.
+
+Usage: python benchmarks/bench_indexes.py [--rows 10000000] [--database-url URL] [--repeat N] [--json PATH]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000_000, help='rides to generate')
+    parser.add_argument('--database-url', default=None,
+                        help='default: a temporary SQLite file; existing rides, payments and users are replaced')
+    parser.add_argument('--repeat', type=int, default=20, help='timed runs per query')
+    parser.add_argument('--batch', type=int, default=1_000_000, help='rows per INSERT ... SELECT')
+    parser.add_argument('--json', dest='json_path', help='write plans and timings to this file')
+    return parser.parse_args()
+
+
+class SyntheticData:
+    """Dialect-specific SQL for filling the tables in bulk"""
+
+    def __init__(self, dialect):
+        self.postgresql = dialect == 'postgresql'
+
+    def series(self, start, stop):
+        if self.postgresql:
+            return f"generate_series({start}, {stop}) AS s(n)"
+        return (f"(WITH RECURSIVE s(n) AS (SELECT {start} UNION ALL SELECT n + 1 FROM s WHERE n < {stop}) "
+                f"SELECT n FROM s) AS s")
+
+    def rand_int(self, k):
+        return f"floor(random() * {k})::int" if self.postgresql else f"(abs(random()) % {k})"
+
+    def ago(self, max_days):
+        if self.postgresql:
+            return f"now() - random() * interval '{max_days} days'"
+        return f"datetime('now', '-' || (abs(random()) % {max_days * 86400}) || ' seconds')"
+
+    def key(self, prefix, number):
+        return f"'{prefix}' || CAST({number} AS TEXT)"
+
+
+def main():
+    args = parse_args()
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        path = os.path.join(tempfile.mkdtemp(prefix='rideshare-indexes-'), 'indexes.sqlite3')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    os.environ.setdefault('SESSION_SECRET', 'bench')
+
+    import logging
+    from sqlalchemy import text
+    from app import app, db
+    from migrations import INDEXES, create_lookup_indexes
+    from models import Payment, Ride, User
+    logging.getLogger().setLevel(logging.WARNING)
+
+    riders = max(1000, args.rows // 50)
+    drivers = max(200, args.rows // 500)
+
+    with app.app_context():
+        engine = db.engine
+        dialect = engine.dialect.name
+        sql = SyntheticData(dialect)
+
+        print(f"Dropping lookup indexes and generating {args.rows:,} rides, {riders:,} riders, "
+              f"{drivers:,} drivers ({dialect})")
+        with engine.begin() as conn:
+            for name, _, _ in INDEXES:
+                conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+            conn.execute(text("DELETE FROM payments"))
+            conn.execute(text("DELETE FROM driver_stats"))
+            conn.execute(text("DELETE FROM rides"))
+            conn.execute(text("DELETE FROM users WHERE id LIKE 'bench-%'"))
+
+        started = time.monotonic()
+        with engine.begin() as conn:
+            true = 'true' if sql.postgresql else '1'
+            conn.execute(text(
+                f"INSERT INTO users (id, role, is_available, rating, total_rides, created_at, updated_at) "
+                f"SELECT {sql.key('bench-r', 'n')}, 'rider', {true}, 5.0, 0, {sql.ago(365)}, {sql.ago(365)} "
+                f"FROM {sql.series(1, riders)}"
+            ))
+            conn.execute(text(
+                f"INSERT INTO users (id, role, is_available, rating, total_rides, current_lat, current_lng, "
+                f"location_updated_at, created_at, updated_at) "
+                f"SELECT {sql.key('bench-d', 'n')}, 'driver', "
+                f"CASE WHEN {sql.rand_int(100)} < 30 THEN {true} ELSE NOT {true} END, 4.5, 100, "
+                f"40.7 + {sql.rand_int(1000)} / 10000.0, -74.0 + {sql.rand_int(1000)} / 10000.0, "
+                f"{sql.ago(1)}, {sql.ago(365)}, {sql.ago(365)} FROM {sql.series(1, drivers)}"
+            ))
+
+        # 98% completed, 1% cancelled, 1% still pending and unassigned
+        for start in range(1, args.rows + 1, args.batch):
+            stop = min(args.rows, start + args.batch - 1)
+            with engine.begin() as conn:
+                conn.execute(text(
+                    f"INSERT INTO rides (id, rider_id, driver_id, pickup_address, dropoff_address, price, status, "
+                    f"distance_km, requested_at) "
+                    f"SELECT n, {sql.key('bench-r', sql.rand_int(riders) + ' + 1')}, "
+                    f"CASE WHEN n % 100 = 0 THEN NULL ELSE {sql.key('bench-d', sql.rand_int(drivers) + ' + 1')} END, "
+                    f"'Pickup', 'Dropoff', 20.0, "
+                    f"CASE WHEN n % 100 = 0 THEN 'pending' WHEN n % 100 = 1 THEN 'cancelled' ELSE 'completed' END, "
+                    f"5.0, {sql.ago(365)} FROM {sql.series(start, stop)}"
+                ))
+                conn.execute(text(
+                    f"INSERT INTO payments (ride_id, rider_id, driver_id, amount, status, payment_method, created_at) "
+                    f"SELECT id, rider_id, driver_id, price, 'completed', 'mock', requested_at FROM rides "
+                    f"WHERE id BETWEEN {start} AND {stop} AND status = 'completed'"
+                ))
+            print(f"  {stop:,} rides ({time.monotonic() - started:.0f}s)")
+
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+
+        sample = db.session.query(Ride.id, Ride.rider_id, Ride.driver_id).filter(
+            Ride.id == args.rows // 2 + 2
+        ).one()
+        queries = {
+            'rider history (latest 20)': Ride.query.filter_by(rider_id=sample.rider_id)
+                .order_by(Ride.requested_at.desc(), Ride.id.desc()).limit(20),
+            'driver history (latest 20)': Ride.query.filter_by(driver_id=sample.driver_id)
+                .order_by(Ride.requested_at.desc(), Ride.id.desc()).limit(20),
+            'rider history (all)': Ride.query.filter_by(rider_id=sample.rider_id)
+                .order_by(Ride.requested_at.desc()),
+            'pending rides (dashboard)': Ride.query.filter_by(status='pending', driver_id=None).limit(10),
+            'pending rides (oldest first)': Ride.query.filter(Ride.status == 'pending', Ride.driver_id.is_(None))
+                .order_by(Ride.requested_at).limit(500),
+            'payment by ride': Payment.query.filter_by(ride_id=sample.id).limit(1),
+            'available drivers with location': User.query.filter_by(role='driver', is_available=True)
+                .filter(User.current_lat.isnot(None), User.current_lng.isnot(None)),
+        }
+        compiled = {
+            name: str(query.statement.compile(engine, compile_kwargs={'literal_binds': True}))
+            for name, query in queries.items()
+        }
+        db.session.rollback()
+
+        def measure(label):
+            results = {}
+            with engine.connect() as conn:
+                for name, statement in compiled.items():
+                    if sql.postgresql:
+                        plan = [row[0] for row in conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {statement}"))]
+                    else:
+                        plan = [row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {statement}"))]
+                    timings = []
+                    for _ in range(args.repeat):
+                        t = time.perf_counter()
+                        rows = len(conn.execute(text(statement)).fetchall())
+                        timings.append((time.perf_counter() - t) * 1000)
+                    results[name] = {'median_ms': round(statistics.median(timings), 3), 'rows': rows, 'plan': plan}
+                    print(f"\n[{label}] {name}: {results[name]['median_ms']} ms, {rows} rows")
+                    for line in plan:
+                        print(f"    {line}")
+            return results
+
+        before = measure('before')
+
+        print("\nBuilding lookup indexes (migration 2)")
+        started = time.monotonic()
+        create_lookup_indexes(engine)
+        build_seconds = time.monotonic() - started
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+        print(f"  built in {build_seconds:.1f}s")
+
+        after = measure('after')
+
+    print(f"\n{'query':<34} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for name in compiled:
+        b, a = before[name]['median_ms'], after[name]['median_ms']
+        print(f"{name:<34} {b:>10} {a:>10} {b / a if a else float('inf'):>7.0f}x")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({
+                'rows': args.rows, 'database': dialect, 'index_build_seconds': round(build_seconds, 1),
+                'queries': {name: {'sql': compiled[name], 'before': before[name], 'after': after[name]}
+                            for name in compiled}
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
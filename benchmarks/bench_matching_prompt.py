@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Compare prompt size and latency of single-ride Gemini matching against one
+batched multi-ride call with the compact table encoding.
+
+Seeds a temporary SQLite city, then matches the same rides both ways and
+reports prompt characters, tokens and wall time. Without GOOGLE_AI_API_KEY a
+local stand-in model records the prompts and tokens are estimated at four
+characters each; with a key, tokens come from the model's count_tokens and
+the times include the real model calls.
+
+Usage: python benchmarks/bench_matching_prompt.py [--rides N] [--drivers N] [--seed N]
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CENTER = (40.7505, -73.9934)  # Midtown Manhattan
+SPREAD_DEG = 0.05
+
+
+class RecordingModel:
+    """Stands in for Gemini: records prompts and answers with the first candidate(s) listed"""
+
+    def __init__(self):
+        self.prompts = []
+
+    def generate_content(self, prompt):
+        self.prompts.append(prompt)
+        single = re.search(r'"driver_id":\s*"([^"]+)"', prompt)
+        if single:
+            text = json.dumps({'selected_driver_id': single.group(1)})
+        else:
+            answers = {}
+            for ride, driver in re.findall(r'^(R\d+)\|(D\d+)\|', prompt, re.MULTILINE):
+                answers.setdefault(ride, driver)
+            text = json.dumps(answers)
+        return type('Response', (), {'text': text})()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rides', type=int, default=10)
+    parser.add_argument('--drivers', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix='rideshare-prompt-'), 'prompt.sqlite3')
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    os.environ.setdefault('SESSION_SECRET', 'bench')
+
+    import logging
+    from app import app, db
+    from models import User
+    from services.ai_matching_service import AIMatchingService
+    logging.getLogger().setLevel(logging.WARNING)
+
+    rng = random.Random(args.seed)
+
+    def point():
+        return CENTER[0] + rng.uniform(-SPREAD_DEG, SPREAD_DEG), CENTER[1] + rng.uniform(-SPREAD_DEG, SPREAD_DEG)
+
+    with app.app_context():
+        rows = []
+        for i in range(args.drivers):
+            lat, lng = point()
+            rows.append({
+                'id': f'{40000000 + i}', 'role': 'driver', 'is_available': True,
+                'rating': round(rng.uniform(3.5, 5.0), 1), 'total_rides': rng.randint(0, 400),
+                'current_lat': lat, 'current_lng': lng, 'location_updated_at': datetime.now(),
+                'vehicle_info': json.dumps({'make': 'Toyota', 'model': 'Camry', 'year': rng.randint(2012, 2024)})
+            })
+        db.session.execute(db.insert(User), rows)
+        db.session.commit()
+
+        rides = []
+        for i in range(args.rides):
+            pickup, dropoff = point(), point()
+            rides.append({
+                'pickup_lat': pickup[0], 'pickup_lng': pickup[1],
+                'dropoff_lat': dropoff[0], 'dropoff_lng': dropoff[1],
+                'pickup_address': f'{100 + i} W 34th St, New York, NY 10001',
+                'dropoff_address': f'{200 + i} E 42nd St, New York, NY 10017',
+                'distance_km': round(rng.uniform(1, 12), 1)
+            })
+
+        matcher = AIMatchingService(deadline_ms=120000)
+        real_model = matcher.model
+        recorder = RecordingModel()
+        if real_model is None:
+            matcher.model = recorder
+        else:
+            # Record the prompts, then forward to the real model
+            def forward(prompt):
+                recorder.prompts.append(prompt)
+                return real_model.generate_content(prompt)
+            matcher.model = type('Forwarding', (), {'generate_content': staticmethod(forward)})()
+
+        started = time.perf_counter()
+        for ride in rides:
+            matcher.find_optimal_driver(ride)
+        single_seconds = time.perf_counter() - started
+        single_prompts = list(recorder.prompts)
+
+        recorder.prompts.clear()
+        started = time.perf_counter()
+        picks = matcher.find_optimal_drivers(rides)
+        batch_seconds = time.perf_counter() - started
+        batch_prompts = list(recorder.prompts)
+
+    def tokens(prompts):
+        if real_model is not None:
+            return sum(real_model.count_tokens(p).total_tokens for p in prompts)
+        return sum(len(p) for p in prompts) // 4
+
+    token_source = 'count_tokens' if real_model is not None else 'estimated, chars/4'
+    latency_source = 'real model calls' if real_model is not None else 'local work only, no model latency'
+    print(f"{args.rides} rides, {args.drivers} drivers")
+    print(f"{'':<28} {'calls':>6} {'chars':>9} {'tokens':>9} {'wall s':>8}")
+    for name, prompts, seconds in (
+        ('single-ride JSON prompts', single_prompts, single_seconds),
+        ('one batched compact prompt', batch_prompts, batch_seconds),
+    ):
+        print(f"{name:<28} {len(prompts):>6} {sum(len(p) for p in prompts):>9} {tokens(prompts):>9} {seconds:>8.2f}")
+    print(f"tokens: {token_source}; wall time: {latency_source}")
+    print(f"batched picks: {sum(p is not None for p in picks)} of {len(picks)} rides, "
+          f"{len({p.id for p in picks if p is not None})} distinct drivers")
+
+
+if __name__ == '__main__':
+    main()
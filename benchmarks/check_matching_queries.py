@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Check that driver matching runs the same number of SQL queries however
+many candidate drivers are near the pickup.
+
+Seeds a temporary SQLite database with two areas far apart, one with few
+and one with many available drivers. It counts the statements
+AIMatchingService.find_optimal_driver executes for a pickup in each area,
+with the basic scorer and with a local stand-in for the Gemini model. The
+driver index and feature store are warmed first, so their periodic reloads
+stay out of the count. Exits non-zero if the count differs between areas.
+
+Usage: python benchmarks/check_matching_queries.py [--small N] [--large N]
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Two pickup areas about 110 km apart, well outside the 15 km search radius
+AREAS = {'small': (40.75, -73.99), 'large': (41.75, -73.99)}
+SPREAD_DEG = 0.03
+
+
+class StandInModel:
+    """Answers like Gemini, picking the first (nearest) driver in the prompt"""
+
+    _DRIVER_ID_RE = re.compile(r'"driver_id":\s*"([^"]+)"')
+
+    def generate_content(self, prompt):
+        match = self._DRIVER_ID_RE.search(prompt)
+        text = json.dumps({'selected_driver_id': match.group(1) if match else None, 'reasoning': 'nearest'})
+        return type('Response', (), {'text': text})()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--small', type=int, default=5, help='candidate drivers in the small area')
+    parser.add_argument('--large', type=int, default=40, help='candidate drivers in the large area')
+    parser.add_argument('--verbose', action='store_true', help='print every statement')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix='rideshare-matching-'), 'matching.sqlite3')
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    os.environ.setdefault('SESSION_SECRET', 'check')
+
+    import logging
+    from sqlalchemy import event
+    from app import app, db
+    from models import DriverStats, Ride, User
+    from services.ai_matching_service import AIMatchingService
+    from services.driver_features import driver_features
+    from services.driver_index import driver_index
+    logging.getLogger().setLevel(logging.WARNING)
+
+    rng = random.Random(7)
+    statements = []
+
+    with app.app_context():
+        rider = User(id='matching-rider', role='rider')
+        db.session.add(rider)
+        users, rides, stats = [], [], []
+        for area, count in (('small', args.small), ('large', args.large)):
+            lat, lng = AREAS[area]
+            for i in range(count):
+                driver_id = f'{area}-driver-{i}'
+                users.append({
+                    'id': driver_id, 'role': 'driver', 'is_available': True,
+                    'rating': round(rng.uniform(3.5, 5.0), 1), 'total_rides': rng.randint(0, 400),
+                    'current_lat': lat + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+                    'current_lng': lng + rng.uniform(-SPREAD_DEG, SPREAD_DEG),
+                    'location_updated_at': datetime.now(),
+                    'vehicle_info': json.dumps({'make': 'Toyota', 'model': 'Camry', 'year': 2020})
+                })
+                # Every candidate has history, so per-driver lookups would show up in the count
+                rides.extend({
+                    'rider_id': rider.id, 'driver_id': driver_id, 'pickup_address': 'A',
+                    'dropoff_address': 'B', 'price': 10.0, 'status': 'completed',
+                    'completed_at': datetime.now()
+                } for _ in range(3))
+                stats.append({'driver_id': driver_id, 'offers': 10, 'accepts': 9})
+        db.session.execute(db.insert(User), users)
+        db.session.execute(db.insert(Ride), rides)
+        db.session.execute(db.insert(DriverStats), stats)
+        db.session.commit()
+
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *rest: statements.append(statement))
+
+        def count(matcher, area):
+            lat, lng = AREAS[area]
+            ride_request = {
+                'pickup_lat': lat, 'pickup_lng': lng, 'dropoff_lat': lat + 0.02, 'dropoff_lng': lng,
+                'pickup_address': 'Pickup', 'dropoff_address': 'Dropoff', 'distance_km': 3.0
+            }
+            statements.clear()
+            driver = matcher.find_optimal_driver(ride_request)
+            if driver is None or not driver.id.startswith(area):
+                raise SystemExit(f"no {area}-area driver matched")
+            if args.verbose:
+                for statement in statements:
+                    print(f"    {' '.join(statement.split())[:160]}")
+            db.session.rollback()
+            return len(statements)
+
+        basic = AIMatchingService()
+        basic.model = None
+        model = AIMatchingService(deadline_ms=60000)
+        model.model = StandInModel()
+
+        # Warm the driver index and feature store; their reloads are periodic, not per match
+        driver_index.reload()
+        driver_features.reload()
+
+        results = {
+            name: {area: count(matcher, area) for area in ('small', 'large')}
+            for name, matcher in (('basic scorer', basic), ('stand-in model', model))
+        }
+
+    failures = []
+    print(f"{'find_optimal_driver':<22} {f'{args.small} drivers':>12} {f'{args.large} drivers':>12}")
+    for name, counts in results.items():
+        print(f"{name:<22} {counts['small']:>12} {counts['large']:>12}")
+        if counts['small'] != counts['large']:
+            failures.append(f"{name}: {counts['small']} queries with {args.small} candidates but "
+                            f"{counts['large']} with {args.large}")
+
+    if failures:
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        sys.exit(1)
+    print("OK: matching query count does not grow with the number of candidates")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Check that the ride list views run a bounded number of SQL queries per
+request, however many rides they show.
+
+Seeds a temporary SQLite database with a rider whose rides each have a
+different driver and a completed payment, logs in through the normal
+session and OAuth token lookup, and counts the statements each view
+executes with a small and a large history. Exits non-zero if a view goes
+over its budget or its query count grows with the number of rides.
+
+Usage: python benchmarks/check_query_counts.py [--small N] [--large N] [--budget N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--small', type=int, default=3, help='rides in the small history')
+    parser.add_argument('--large', type=int, default=60, help='rides in the large history')
+    parser.add_argument('--budget', type=int, default=10, help='maximum queries per request')
+    parser.add_argument('--verbose', action='store_true', help='print every statement')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix='rideshare-queries-'), 'queries.sqlite3')
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    os.environ.setdefault('SESSION_SECRET', 'check')
+    os.environ.setdefault('REPL_ID', 'check')
+    # Assign rides inline and leave background threads out of the count
+    os.environ['DISPATCH_WORKERS'] = '0'
+
+    import logging
+    from sqlalchemy import event
+    from app import app, db
+    from models import OAuth, Payment, Ride, User
+    import routes  # noqa: F401
+    from services.pending_rides import pending_rides
+    logging.getLogger().setLevel(logging.WARNING)
+
+    statements = []
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *rest: statements.append(statement))
+
+    def seed(prefix, rides):
+        """A rider and a driver whose histories are `rides` long, each ride with another party"""
+        rider_id, driver_id = f'{prefix}-rider', f'{prefix}-driver'
+        users = [{'id': rider_id, 'role': 'rider', 'first_name': 'Rita'},
+                 {'id': driver_id, 'role': 'driver', 'first_name': 'Dan', 'is_available': True}]
+        ride_rows = []
+        started = datetime(2025, 1, 1)
+        for i in range(rides):
+            users.append({'id': f'{prefix}-other-driver-{i}', 'role': 'driver', 'first_name': f'D{i}'})
+            users.append({'id': f'{prefix}-other-rider-{i}', 'role': 'rider', 'first_name': f'R{i}'})
+            for ride_rider, ride_driver in ((rider_id, f'{prefix}-other-driver-{i}'),
+                                            (f'{prefix}-other-rider-{i}', driver_id)):
+                ride_rows.append({
+                    'rider_id': ride_rider, 'driver_id': ride_driver, 'pickup_address': 'A',
+                    'dropoff_address': 'B', 'price': 12.5, 'status': 'completed', 'distance_km': 3.0,
+                    'estimated_duration': 9, 'requested_at': started + timedelta(minutes=i)
+                })
+        # Unassigned rides for the driver dashboard's pending list
+        for i in range(rides):
+            ride_rows.append({'rider_id': f'{prefix}-other-rider-{i}', 'pickup_address': 'C',
+                              'dropoff_address': 'D', 'price': 8.0, 'status': 'pending'})
+
+        with app.app_context():
+            db.session.execute(db.insert(User), users)
+            db.session.execute(db.insert(Ride), ride_rows)
+            db.session.flush()
+            db.session.execute(db.insert(Payment), [
+                {'ride_id': ride.id, 'rider_id': ride.rider_id, 'driver_id': ride.driver_id,
+                 'amount': ride.price, 'status': 'completed', 'processed_at': datetime.now()}
+                for ride in Ride.query.filter(Ride.status == 'completed', Ride.rider_id.like(f'{prefix}-%'))
+            ])
+            for user_id in (rider_id, driver_id):
+                db.session.add(OAuth(user_id=user_id, browser_session_key=f'{user_id}-browser',
+                                     provider='replit_auth', token={'expires_in': 3600}))
+            db.session.commit()
+            receipt_ride = Ride.query.filter_by(rider_id=rider_id).first().id
+            # Rows inserted in bulk bypass the ride write paths that keep the feed current
+            pending_rides.reload()
+        return rider_id, driver_id, receipt_ride
+
+    def count(user_id, url):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = user_id
+            session['_fresh'] = True
+            session['_browser_session_key'] = f'{user_id}-browser'
+        statements.clear()
+        response = client.get(url)
+        if response.status_code != 200:
+            raise SystemExit(f"GET {url} as {user_id} returned {response.status_code}")
+        if args.verbose:
+            for statement in statements:
+                print(f"    {' '.join(statement.split())[:160]}")
+        return len(statements)
+
+    def views(rider_id, driver_id, receipt_ride):
+        return {
+            'rider dashboard': count(rider_id, '/rider_dashboard'),
+            'driver dashboard': count(driver_id, '/driver_dashboard'),
+            'ride history (rider)': count(rider_id, '/ride_history'),
+            'ride history (driver)': count(driver_id, '/ride_history'),
+            'receipt download': count(rider_id, f'/download_receipt/{receipt_ride}'),
+        }
+
+    small = views(*seed('small', args.small))
+    large = views(*seed('large', args.large))
+
+    failures = []
+    print(f"{'view':<24} {f'{args.small} rides':>10} {f'{args.large} rides':>10}")
+    for name in small:
+        print(f"{name:<24} {small[name]:>10} {large[name]:>10}")
+        if large[name] > args.budget:
+            failures.append(f"{name}: {large[name]} queries, budget {args.budget}")
+        if large[name] != small[name]:
+            failures.append(f"{name}: {small[name]} queries with {args.small} rides but "
+                            f"{large[name]} with {args.large}")
+
+    if failures:
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        sys.exit(1)
+    print(f"OK: every view stays within {args.budget} queries regardless of history length")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Check read-replica routing locally with two SQLite databases.
+
+The replica starts as a copy of the primary, then the primary gets a ride
+the replica never sees, so every page shows which database served it.
+Checks that read-only views use the replica, that a user who just wrote
+reads from the primary, that writes always reach the primary, and that
+reads fall back to the primary when the staleness tolerance is exceeded.
+Exits non-zero on the first broken expectation.
+
+Usage: python benchmarks/check_replica_routing.py
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='rideshare-replica-')
+    primary_path = os.path.join(directory, 'primary.sqlite3')
+    replica_path = os.path.join(directory, 'replica.sqlite3')
+    os.environ['DATABASE_URL'] = f'sqlite:///{primary_path}'
+    os.environ['DATABASE_REPLICA_URL'] = f'sqlite:///{replica_path}'
+    os.environ['DATABASE_REPLICA_MAX_LAG_SECONDS'] = '5'
+    os.environ.setdefault('SESSION_SECRET', 'check')
+    os.environ.setdefault('REPL_ID', 'check')
+    os.environ['DISPATCH_WORKERS'] = '0'
+
+    import logging
+    from sqlalchemy import event
+    from app import app, db
+    from models import OAuth, Ride, User
+    from replica import REPLICA_BIND
+    import routes  # noqa: F401
+    logging.getLogger().setLevel(logging.WARNING)
+
+    reads = Counter()  # engine name -> statements
+    with app.app_context():
+        for name, engine in (('primary', db.engine), ('replica', db.engines[REPLICA_BIND])):
+            event.listen(engine, 'before_cursor_execute',
+                         lambda *args, name=name: reads.update([name]))
+
+        db.session.execute(db.insert(User), [
+            {'id': 'rider-a', 'role': 'rider'}, {'id': 'rider-b', 'role': 'rider'},
+        ])
+        for rider_id in ('rider-a', 'rider-b'):
+            db.session.add(Ride(rider_id=rider_id, pickup_address='Replicated pickup',
+                                dropoff_address='B', price=10.0))
+            db.session.add(OAuth(user_id=rider_id, browser_session_key=f'{rider_id}-browser',
+                                 provider='replit_auth', token={'expires_in': 3600}))
+        db.session.commit()
+
+        # "Replicate" the primary as it is now, then write what the replica has not seen yet
+        with sqlite3.connect(primary_path) as source, sqlite3.connect(replica_path) as target:
+            source.backup(target)
+        for rider_id in ('rider-a', 'rider-b'):
+            db.session.add(Ride(rider_id=rider_id, pickup_address='Unreplicated pickup',
+                                dropoff_address='B', price=10.0))
+        db.session.commit()
+        first_ride = Ride.query.filter_by(rider_id='rider-a', pickup_address='Replicated pickup').one().id
+
+    def client_for(user_id):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = user_id
+            session['_fresh'] = True
+            session['_browser_session_key'] = f'{user_id}-browser'
+        return client
+
+    def served_by(client, url):
+        reads.clear()
+        response = client.get(url)
+        if response.status_code != 200:
+            raise SystemExit(f"GET {url} returned {response.status_code}")
+        body = response.get_data(as_text=True)
+        return 'primary' if 'Unreplicated pickup' in body else 'replica', dict(reads)
+
+    failures = []
+
+    def expect(description, actual, expected):
+        print(f"{'ok  ' if actual == expected else 'FAIL'} {description}: {actual}")
+        if actual != expected:
+            failures.append(description)
+
+    rider_a, rider_b = client_for('rider-a'), client_for('rider-b')
+
+    source, counts = served_by(rider_a, '/ride_history')
+    expect('ride history is served by', source, 'replica')
+    print(f"     statements: {counts}")
+
+    rider_a.post(f'/update_ride_status/{first_ride}', data={'status': 'cancelled'})
+    with app.app_context():
+        expect('the write landed on the primary', db.session.get(Ride, first_ride).status, 'cancelled')
+
+    source, counts = served_by(rider_a, '/ride_history')
+    expect('right after writing, the writer reads from', source, 'primary')
+    print(f"     statements: {counts}")
+
+    source, _ = served_by(rider_b, '/ride_history')
+    expect('other users still read from', source, 'replica')
+
+    os.environ['DATABASE_REPLICA_MAX_LAG_SECONDS'] = '-1'
+    source, _ = served_by(rider_b, '/ride_history')
+    expect('with the replica past the staleness tolerance, reads come from', source, 'primary')
+
+    if failures:
+        sys.exit(1)
+    print("OK: reads routed to the replica, writes and read-your-writes on the primary")
+
+
+if __name__ == '__main__':
+    main()
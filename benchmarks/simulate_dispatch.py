@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Simulate dispatch load against a local database and report per-operation
+throughput, latency percentiles and pickup-distance quality.
+
+A synthetic city of drivers and riders is seeded, then a mix of operations
+is issued open-loop at a target rate from a pool of worker threads:
+
+  update_location       LocationService.update_driver_location
+  find_optimal_driver   AIMatchingService.find_optimal_driver
+  create_ride           RideService.create_ride (assigns inline)
+  assign_driver         RideService.assign_driver on a fresh pending ride
+  complete_ride         RideService.update_ride_status -> completed (frees drivers)
+
+Google Maps keys are cleared so no external calls are made; Gemini is
+replaced by a local stand-in when --ai-latency-ms is given.
+
+Usage:
+  python benchmarks/simulate_dispatch.py [--drivers N] [--riders N] [--rate OPS] [--duration S]
+  python benchmarks/simulate_dispatch.py --json results.json
+  python benchmarks/simulate_dispatch.py --baseline results.json [--max-regression 0.25]
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CENTER = (40.7505, -73.9934)  # Midtown Manhattan
+SPREAD_DEG = 0.08
+
+DEFAULT_MIX = 'update_location=60,find_optimal_driver=15,create_ride=10,complete_ride=10,assign_driver=5'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--drivers', type=int, default=500)
+    parser.add_argument('--riders', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=100, help='operations per second')
+    parser.add_argument('--duration', type=float, default=15, help='seconds of load')
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='op=weight,... (default: %(default)s)')
+    parser.add_argument('--ai-latency-ms', type=float, default=None,
+                        help='use a stand-in Gemini model answering after this many ms')
+    parser.add_argument('--database-url', default=None, help='default: a temporary SQLite file')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', dest='json_path', help='write results to this file')
+    parser.add_argument('--baseline', help='compare against results written by --json')
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help='allowed p95 latency growth over the baseline (default: %(default)s)')
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    """Must run before the app is imported: it reads these at import time"""
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        path = os.path.join(tempfile.mkdtemp(prefix='rideshare-sim-'), 'sim.sqlite3')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    os.environ.setdefault('SESSION_SECRET', 'simulation')
+    os.environ['BATCH_DISPATCH_INTERVAL_SECONDS'] = '0'
+    for key in ('GOOGLE_MAPS_API_KEY', 'GOOGLE_AI_API_KEY'):
+        os.environ.pop(key, None)
+
+
+class StandInModel:
+    """Answers like Gemini after a fixed delay, picking the first (nearest) driver in the prompt"""
+
+    _DRIVER_ID_RE = re.compile(r'"driver_id":\s*"([^"]+)"')
+
+    def __init__(self, latency_seconds):
+        self.latency_seconds = latency_seconds
+
+    def generate_content(self, prompt):
+        time.sleep(self.latency_seconds)
+        match = self._DRIVER_ID_RE.search(prompt)
+        text = json.dumps({'selected_driver_id': match.group(1) if match else None, 'reasoning': 'nearest'})
+        return type('Response', (), {'text': text})()
+
+
+def random_point(rng):
+    return (CENTER[0] + rng.uniform(-SPREAD_DEG, SPREAD_DEG), CENTER[1] + rng.uniform(-SPREAD_DEG, SPREAD_DEG))
+
+
+class Simulation:
+    def __init__(self, args):
+        from app import app, db
+        from models import DriverStats, Ride, User
+        from services.ai_matching_service import AIMatchingService
+        from services.location_service import LocationService
+        from services.ride_service import RideService
+
+        self.args = args
+        self.app, self.db = app, db
+        self.DriverStats, self.Ride, self.User = DriverStats, Ride, User
+        self.LocationService, self.RideService = LocationService, RideService
+
+        self.matcher = AIMatchingService()
+        if args.ai_latency_ms is not None:
+            self.matcher.model = StandInModel(args.ai_latency_ms / 1000)
+
+        self.rng = random.Random(args.seed)
+        self.rng_lock = threading.Lock()
+        self.driver_ids = [f'sim-driver-{i}' for i in range(args.drivers)]
+        self.rider_ids = [f'sim-rider-{i}' for i in range(args.riders)]
+
+        self.results_lock = threading.Lock()
+        self.latencies = {}  # op -> [seconds]
+        self.errors = {}  # op -> count
+        self.pickup_km = {}  # op -> [km to the chosen driver]
+        self.excess_km = []  # find_optimal_driver: km beyond the nearest candidate
+        self.lag = []  # seconds each op started after its scheduled time
+
+    def seed(self):
+        """Insert the synthetic city in bulk"""
+        User, Ride = self.User, self.Ride
+        with self.app.app_context():
+            self.database = self.db.engine.dialect.name
+            self.db.session.query(Ride).filter(Ride.rider_id.like('sim-%')).delete(synchronize_session=False)
+            self.db.session.query(self.DriverStats).filter(
+                self.DriverStats.driver_id.like('sim-%')
+            ).delete(synchronize_session=False)
+            self.db.session.query(User).filter(User.id.like('sim-%')).delete(synchronize_session=False)
+            now = datetime.now()
+            rows = []
+            for driver_id in self.driver_ids:
+                lat, lng = random_point(self.rng)
+                rows.append({
+                    'id': driver_id, 'role': 'driver', 'is_available': True,
+                    'rating': round(self.rng.uniform(3.5, 5.0), 1), 'total_rides': self.rng.randint(0, 400),
+                    'current_lat': lat, 'current_lng': lng, 'location_updated_at': now,
+                    'vehicle_info': json.dumps({'type': 'sedan', 'year': self.rng.randint(2012, 2024)})
+                })
+            rows.extend({'id': rider_id, 'role': 'rider'} for rider_id in self.rider_ids)
+            self.db.session.execute(self.db.insert(User), rows)
+            self.db.session.commit()
+
+    # ------------------------------------------------------------------
+    # Operations; each returns the pickup distance of the chosen driver, if any
+    # ------------------------------------------------------------------
+
+    def op_update_location(self):
+        with self.rng_lock:
+            driver_id = self.rng.choice(self.driver_ids)
+            lat, lng = random_point(self.rng)
+        self.LocationService.update_driver_location(driver_id, lat, lng)
+
+    def op_find_optimal_driver(self):
+        with self.rng_lock:
+            pickup, dropoff = random_point(self.rng), random_point(self.rng)
+        driver = self.matcher.find_optimal_driver({
+            'pickup_lat': pickup[0], 'pickup_lng': pickup[1],
+            'dropoff_lat': dropoff[0], 'dropoff_lng': dropoff[1],
+            'pickup_address': 'Simulated pickup', 'dropoff_address': 'Simulated dropoff'
+        })
+        if driver is None:
+            return None
+        chosen = self._pickup_distance(driver, pickup)
+        nearest = self.LocationService.find_nearest_drivers(pickup[0], pickup[1], k=1, max_radius_km=15)
+        if nearest:
+            with self.results_lock:
+                self.excess_km.append(chosen - nearest[0]['distance_km'])
+        return chosen
+
+    def op_create_ride(self):
+        with self.rng_lock:
+            rider_id = self.rng.choice(self.rider_ids)
+            pickup, dropoff = random_point(self.rng), random_point(self.rng)
+        ride = self.RideService.create_ride(rider_id, 'Simulated pickup', 'Simulated dropoff', pickup, dropoff)
+        return self._assigned_pickup_distance(ride.id, pickup)
+
+    def op_assign_driver(self):
+        with self.rng_lock:
+            rider_id = self.rng.choice(self.rider_ids)
+            pickup = random_point(self.rng)
+        ride = self.Ride(rider_id=rider_id, pickup_address='Simulated pickup', dropoff_address='Simulated dropoff',
+                         pickup_lat=pickup[0], pickup_lng=pickup[1], price=10.0)
+        self.db.session.add(ride)
+        self.db.session.commit()
+
+        started = time.perf_counter()
+        self.RideService.assign_driver(ride.id)
+        elapsed = time.perf_counter() - started
+        return self._assigned_pickup_distance(ride.id, pickup), elapsed
+
+    def op_complete_ride(self):
+        Ride = self.Ride
+        ride = Ride.query.filter(Ride.status == 'accepted', Ride.rider_id.like('sim-%')).order_by(
+            Ride.accepted_at
+        ).first()
+        if ride is not None:
+            self.RideService.update_ride_status(ride.id, 'completed', ride.driver_id)
+
+    def _assigned_pickup_distance(self, ride_id, pickup):
+        ride = self.db.session.get(self.Ride, ride_id)
+        if ride is None or ride.driver_id is None:
+            return None
+        return self._pickup_distance(self.db.session.get(self.User, ride.driver_id), pickup)
+
+    def _pickup_distance(self, driver, pickup):
+        lat, lng, _ = self.LocationService.get_driver_position(driver)
+        return self.LocationService._calculate_haversine_distance(pickup[0], pickup[1], lat, lng)
+
+    # ------------------------------------------------------------------
+    # Load generation
+    # ------------------------------------------------------------------
+
+    def run_op(self, name, scheduled_at):
+        started = time.perf_counter()
+        pickup_km = None
+        try:
+            with self.app.app_context():
+                result = getattr(self, f'op_{name}')()
+            elapsed = time.perf_counter() - started
+            if isinstance(result, tuple):
+                # The op timed only its target call
+                pickup_km, elapsed = result
+            else:
+                pickup_km = result
+        except Exception:
+            with self.results_lock:
+                self.errors[name] = self.errors.get(name, 0) + 1
+            return
+
+        with self.results_lock:
+            self.latencies.setdefault(name, []).append(elapsed)
+            self.lag.append(max(0.0, started - scheduled_at))
+            if pickup_km is not None:
+                self.pickup_km.setdefault(name, []).append(pickup_km)
+
+    def run(self, mix):
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        total_ops = int(self.args.rate * self.args.duration)
+        schedule_rng = random.Random(self.args.seed + 1)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.args.workers) as pool:
+            for i in range(total_ops):
+                scheduled_at = started + i / self.args.rate
+                delay = scheduled_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self.run_op, schedule_rng.choices(names, weights)[0], scheduled_at)
+        return time.perf_counter() - started
+
+    def report(self, wall_seconds):
+        ops = {}
+        for name in sorted(set(self.latencies) | set(self.errors)):
+            samples = np.array(self.latencies.get(name, [])) * 1000
+            entry = {
+                'count': int(samples.size),
+                'errors': self.errors.get(name, 0),
+                'throughput_per_s': round(samples.size / wall_seconds, 1)
+            }
+            if samples.size:
+                p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+                entry.update({'p50_ms': round(p50, 2), 'p95_ms': round(p95, 2), 'p99_ms': round(p99, 2)})
+            if self.pickup_km.get(name):
+                entry['mean_pickup_km'] = round(float(np.mean(self.pickup_km[name])), 3)
+            ops[name] = entry
+
+        total = sum(entry['count'] for entry in ops.values())
+        return {
+            'config': {
+                'drivers': self.args.drivers, 'riders': self.args.riders, 'rate': self.args.rate,
+                'duration': self.args.duration, 'workers': self.args.workers, 'mix': self.args.mix,
+                'ai_latency_ms': self.args.ai_latency_ms, 'database': self.database
+            },
+            'wall_seconds': round(wall_seconds, 2),
+            'throughput_per_s': round(total / wall_seconds, 1),
+            'schedule_lag_p99_ms': round(float(np.percentile(self.lag, 99)) * 1000, 2) if self.lag else None,
+            'matching_excess_km_mean': round(float(np.mean(self.excess_km)), 3) if self.excess_km else None,
+            'operations': ops
+        }
+
+
+def print_report(results):
+    config = results['config']
+    print(f"{config['drivers']} drivers, {config['riders']} riders, target {config['rate']}/s for "
+          f"{config['duration']}s on {config['workers']} workers ({config['database']})")
+    print(f"achieved {results['throughput_per_s']}/s, schedule lag p99 {results['schedule_lag_p99_ms']} ms")
+    print(f"{'operation':<20} {'count':>6} {'err':>4} {'ops/s':>7} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'pickup km':>9}")
+    for name, entry in results['operations'].items():
+        print(f"{name:<20} {entry['count']:>6} {entry['errors']:>4} {entry['throughput_per_s']:>7} "
+              f"{entry.get('p50_ms', '-'):>8} {entry.get('p95_ms', '-'):>8} {entry.get('p99_ms', '-'):>8} "
+              f"{entry.get('mean_pickup_km', '-'):>9}")
+    if results['matching_excess_km_mean'] is not None:
+        print(f"find_optimal_driver picks are {results['matching_excess_km_mean']} km farther than "
+              f"the nearest driver on average")
+
+
+def compare_to_baseline(results, baseline_path, max_regression):
+    """Print p95 changes against a baseline; return the operations that regressed"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    regressed = []
+    for name, entry in results['operations'].items():
+        before = baseline['operations'].get(name, {}).get('p95_ms')
+        after = entry.get('p95_ms')
+        if not before or after is None:
+            continue
+        change = after / before - 1
+        print(f"{name:<20} p95 {before:>8} -> {after:>8} ms ({change:+.0%})")
+        if change > max_regression:
+            regressed.append(name)
+    return regressed
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def main():
+    args = parse_args()
+    configure_environment(args)
+    mix = parse_mix(args.mix)
+
+    import logging
+    sim = Simulation(args)
+    logging.getLogger().setLevel(logging.WARNING)
+    unknown = [name for name in mix if not hasattr(sim, f'op_{name}')]
+    if unknown:
+        sys.exit(f"Unknown operations in --mix: {', '.join(unknown)}")
+
+    sim.seed()
+    results = sim.report(sim.run(mix))
+    print_report(results)
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        regressed = compare_to_baseline(results, args.baseline, args.max_regression)
+        if regressed:
+            sys.exit(f"p95 regressed more than {args.max_regression:.0%}: {', '.join(regressed)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Stress driver and ride claiming with many concurrent claimers, then check
+that no driver was booked twice and no ride was taken twice.
+
+First every ride is booked through RideService.assign_driver at once, with
+more rides than drivers; then three drivers race RideService.accept_ride
+on each of a fresh set of rides. Exits non-zero if an invariant is broken.
+
+Usage: python benchmarks/stress_claims.py [--drivers N] [--rides N] [--threads N] [--database-url URL]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--drivers', type=int, default=50)
+    parser.add_argument('--rides', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--database-url', default=None, help='default: a temporary SQLite file')
+    parser.add_argument('--seed', type=int, default=7)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        path = os.path.join(tempfile.mkdtemp(prefix='rideshare-claims-'), 'claims.sqlite3')
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    os.environ.setdefault('SESSION_SECRET', 'stress')
+
+    import logging
+    from app import app, db
+    from models import Ride, User
+    from services.ride_service import RideService
+    logging.getLogger().setLevel(logging.WARNING)
+
+    driver_ids = [f'stress-driver-{i}' for i in range(args.drivers)]
+    with app.app_context():
+        db.session.query(Ride).filter(Ride.rider_id == 'stress-rider').delete(synchronize_session=False)
+        db.session.query(User).filter(User.id.like('stress-%')).delete(synchronize_session=False)
+        db.session.execute(db.insert(User), [{'id': 'stress-rider', 'role': 'rider'}] + [
+            {'id': driver_id, 'role': 'driver', 'is_available': True} for driver_id in driver_ids
+        ])
+        db.session.commit()
+        database = db.engine.dialect.name
+
+    def create_rides(count):
+        with app.app_context():
+            rides = [
+                Ride(rider_id='stress-rider', pickup_address='A', dropoff_address='B', price=10.0)
+                for _ in range(count)
+            ]
+            db.session.add_all(rides)
+            db.session.commit()
+            return [ride.id for ride in rides]
+
+    def run_claims(jobs, claim):
+        outcomes = Counter()
+        lock = threading.Lock()
+
+        def run(job):
+            try:
+                with app.app_context():
+                    result = 'won' if claim(*job) else 'lost'
+            except Exception as e:
+                result = f'error: {type(e).__name__}'
+            with lock:
+                outcomes[result] += 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            list(pool.map(run, jobs))
+        elapsed = time.perf_counter() - started
+        print(f"  {len(jobs)} claims in {elapsed:.2f}s ({len(jobs) / elapsed:.0f}/s): "
+              + ', '.join(f"{result} {count}" for result, count in sorted(outcomes.items())))
+        return outcomes
+
+    def assigned_drivers(ride_ids):
+        with app.app_context():
+            return [driver_id for (driver_id,) in db.session.query(Ride.driver_id).filter(
+                Ride.id.in_(ride_ids),
+                Ride.driver_id.isnot(None)
+            )]
+
+    problems = []
+    rng = random.Random(args.seed)
+    print(f"{args.drivers} drivers, {args.rides} rides, {args.threads} threads ({database})")
+
+    # Phase 1: more bookings than drivers, all claiming at once
+    print("assign_driver, one claimer per ride:")
+    ride_ids = create_rides(args.rides)
+    outcomes = run_claims([(ride_id,) for ride_id in ride_ids], RideService.assign_driver)
+    drivers = assigned_drivers(ride_ids)
+    rides_per_driver = Counter(drivers)
+    if outcomes['won'] != len(drivers):
+        problems.append(f"assign_driver: {outcomes['won']} claims won but {len(drivers)} rides are assigned")
+    if any(count > 1 for count in rides_per_driver.values()):
+        problems.append(f"assign_driver: {sum(c > 1 for c in rides_per_driver.values())} drivers got several rides")
+    with app.app_context():
+        if db.session.query(User.id).filter(User.id.in_(drivers), User.is_available.is_(True)).count():
+            problems.append("assign_driver: an assigned driver is still marked available")
+    if len(drivers) < min(args.drivers, args.rides) and not any(r.startswith('error') for r in outcomes):
+        problems.append(f"assign_driver: only {len(drivers)} rides assigned with {args.drivers} drivers free")
+
+    # Phase 2: several drivers racing to accept each ride. Half the drivers come
+    # off their phase 1 rides; the rest are still busy and must not win any.
+    freed = driver_ids[:len(driver_ids) // 2]
+    with app.app_context():
+        User.query.filter(User.id.in_(freed)).update({User.is_available: True}, synchronize_session=False)
+        db.session.commit()
+        busy = {driver_id for (driver_id,) in db.session.query(User.id).filter(
+            User.id.in_(driver_ids), User.is_available.is_(False)
+        )}
+    print(f"accept_ride, three drivers racing per ride ({len(busy)} of them already busy):")
+    ride_ids = create_rides(args.rides)
+    jobs = [(ride_id, driver_id) for ride_id in ride_ids for driver_id in rng.sample(driver_ids, 3)]
+    rng.shuffle(jobs)
+    outcomes = run_claims(jobs, RideService.accept_ride)
+    drivers = assigned_drivers(ride_ids)
+    rides_per_driver = Counter(drivers)
+    if outcomes['won'] != len(drivers):
+        problems.append(f"accept_ride: {outcomes['won']} accepts won but {len(drivers)} rides are assigned")
+    if any(count > 1 for count in rides_per_driver.values()):
+        problems.append(f"accept_ride: {sum(c > 1 for c in rides_per_driver.values())} drivers got several rides")
+    if busy & set(drivers):
+        problems.append(f"accept_ride: {len(busy & set(drivers))} drivers already on a ride accepted another")
+    with app.app_context():
+        if db.session.query(User.id).filter(User.id.in_(drivers), User.is_available.is_(True)).count():
+            problems.append("accept_ride: a driver who won a ride is still marked available")
+
+    if problems:
+        for problem in problems:
+            print(f"FAIL: {problem}")
+        sys.exit(1)
+    print("OK: no driver was booked twice and no ride was accepted twice")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+Versioned schema migrations.
+
+Each migration runs once per database, in version order, and is recorded
+in the schema_version table. Migration 1 creates any missing tables from
+the models, so a fresh database and one created by the old bare
+db.create_all() both continue from the same point. Because a fresh
+database gets its tables from the current models, later migrations must
+be safe to run on a schema that already has their change (IF NOT EXISTS).
+
+Worker startup (see app.py) applies migrations up to STARTUP_MIGRATION
+only. Everything after it, such as index builds that take minutes on a
+large rides table, runs with `flask migrate` as a deploy step; workers
+log a warning while any are pending.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, text
+from app import db
+
+# Key for the PostgreSQL advisory lock that lets one process migrate at a time
+_MIGRATION_LOCK_KEY = 724552
+
+# Last migration cheap enough to apply while a worker boots (within gunicorn's boot timeout)
+STARTUP_MIGRATION = 1
+
+_version_metadata = MetaData()
+schema_version = Table(
+    'schema_version', _version_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False, default=datetime.now)
+)
+
+MIGRATIONS = []  # (version, description, function(engine)), in order
+
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+# (name, table and columns, partial index condition or None) for the hot lookup paths.
+# {true} is the dialect's boolean literal.
+INDEXES = [
+    # Ride history and dashboards: filter by rider or driver, newest first, (requested_at, id) keyset
+    ('ix_rides_rider_requested', 'rides (rider_id, requested_at, id)', None),
+    ('ix_rides_driver_requested', 'rides (driver_id, requested_at, id)', 'driver_id IS NOT NULL'),
+    # Pending-ride feeds, the dispatch sweeper and the batch dispatcher
+    ('ix_rides_pending_unassigned', 'rides (requested_at)', "status = 'pending' AND driver_id IS NULL"),
+    # PaymentService.get_payment_by_ride
+    ('ix_payments_ride_id', 'payments (ride_id)', None),
+    # Driver index reloads and proximity search: available drivers with a location
+    ('ix_users_available_drivers', 'users (current_lat, current_lng)',
+     "role = 'driver' AND is_available = {true} AND current_lat IS NOT NULL AND current_lng IS NOT NULL"),
+]
+
+
+@migration(1, 'Create tables from models')
+def create_tables(engine):
+    import models  # noqa: F401
+    db.metadata.create_all(engine)
+
+
+@migration(2, 'Indexes for ride, payment and driver lookup paths')
+def create_lookup_indexes(engine):
+    for name, columns, where in INDEXES:
+        create_index(engine, name, columns, where)
+
+
+def create_index(engine, name, columns, where=None):
+    """
+    CREATE INDEX IF NOT EXISTS, built CONCURRENTLY on PostgreSQL so large
+    tables stay writable while it runs. A PostgreSQL index left invalid by
+    an interrupted concurrent build is dropped and rebuilt.
+    """
+    postgresql = engine.dialect.name == 'postgresql'
+    if where:
+        where = where.format(true='true' if postgresql else '1')
+    concurrently = 'CONCURRENTLY ' if postgresql else ''
+    ddl = f"CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {columns}" + (f" WHERE {where}" if where else '')
+
+    # CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        if postgresql:
+            invalid = conn.execute(text(
+                "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name AND NOT i.indisvalid"
+            ), {'name': name}).first()
+            if invalid:
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        started = time.monotonic()
+        conn.execute(text(ddl))
+        logging.info(f"Index {name} ready in {time.monotonic() - started:.1f}s")
+
+
+def applied_versions(engine):
+    _version_metadata.create_all(engine)
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(schema_version.select().with_only_columns(schema_version.c.version))}
+
+
+def pending_migrations(engine, through=None):
+    """Migrations up to version `through` (default: all) the database has not applied"""
+    done = applied_versions(engine) if inspect(engine).has_table('schema_version') else set()
+    return [m for m in MIGRATIONS if (through is None or m[0] <= through) and m[0] not in done]
+
+
+def run_migrations(engine=None, through=None):
+    """
+    Apply the migrations up to version `through` (default: all) the
+    database has not seen yet. Returns the versions applied.
+    """
+    engine = engine or db.engine
+    # Nothing to do is the common case at worker startup; skip the lock for it
+    if not pending_migrations(engine, through):
+        return []
+    with _migration_lock(engine):
+        done = applied_versions(engine)
+        applied = []
+        for version, description, fn in MIGRATIONS:
+            if version in done or (through is not None and version > through):
+                continue
+            logging.info(f"Applying migration {version}: {description}")
+            fn(engine)
+            with engine.begin() as conn:
+                conn.execute(schema_version.insert().values(
+                    version=version, description=description, applied_at=datetime.now()
+                ))
+            applied.append(version)
+        return applied
+
+
+@contextmanager
+def _migration_lock(engine, poll_seconds=1.0):
+    """
+    Session-level advisory lock on PostgreSQL, so only one process migrates
+    while the others wait. It is polled with pg_try_advisory_lock: a worker
+    blocked inside pg_advisory_lock would hold a snapshot that
+    CREATE INDEX CONCURRENTLY has to wait for.
+    """
+    if engine.dialect.name != 'postgresql':
+        yield
+        return
+
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        lock = text('SELECT pg_try_advisory_lock(:key)')
+        while not conn.execute(lock, {'key': _MIGRATION_LOCK_KEY}).scalar():
+            time.sleep(poll_seconds)
+        try:
+            yield
+        finally:
+            conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': _MIGRATION_LOCK_KEY})
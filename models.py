@@ -74,6 +74,16 @@ class Ride(db.Model):
     # Special requests or notes
     notes = db.Column(db.Text, nullable=True)
 
+class DriverStats(db.Model):
+    __tablename__ = 'driver_stats'
+    driver_id = db.Column(db.String, db.ForeignKey('users.id'), primary_key=True)
+    
+    # Rides handed to the driver whose outcome is known, and those the driver went on to start
+    offers = db.Column(db.Integer, nullable=False, default=0)
+    accepts = db.Column(db.Integer, nullable=False, default=0)
+    
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
 class Payment(db.Model):
     __tablename__ = 'payments'
     id = db.Column(db.Integer, primary_key=True)
@@ -0,0 +1,163 @@
+"""
+Read-replica routing for db.session.
+
+When DATABASE_REPLICA_URL is set, reads inside a `@replica_reads` view or a
+`use_replica()` block go to the replica engine (the 'replica' entry of
+SQLALCHEMY_BINDS). Everything else stays on the primary:
+
+- writes, and every read in a transaction after it has flushed a write
+- locking reads (FOR UPDATE), and raw SQL that is not a SELECT
+- all reads of a browser session for DATABASE_REPLICA_MAX_LAG_SECONDS
+  after it committed a write, so users always see their own changes
+- all reads while the replica is further behind than that tolerance,
+  or unreachable
+
+Replication lag is measured on the replica at most every
+DATABASE_REPLICA_CHECK_SECONDS. On PostgreSQL it is the age of the last
+replayed transaction, or zero once the replica has replayed all the WAL
+it has received; other databases, such as two local SQLite files, report
+no lag.
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from flask import has_request_context, session as browser_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.sql import Select
+
+REPLICA_BIND = 'replica'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+# Flask session key: reads stay on the primary until this time after the user's last write
+_PRIMARY_UNTIL_KEY = '_read_primary_until'
+
+
+def replica_url():
+    return os.environ.get('DATABASE_REPLICA_URL')
+
+
+def max_lag_seconds():
+    return float(os.environ.get('DATABASE_REPLICA_MAX_LAG_SECONDS', 5))
+
+
+@contextmanager
+def use_replica():
+    """Let reads in this block go to the replica when it is fresh enough"""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_reads(f):
+    """Decorator for read-only views and service methods; see use_replica"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        with use_replica():
+            return f(*args, **kwargs)
+    return decorated_function
+
+
+class ReplicaLagMonitor:
+    """Cached replication lag of the replica engine; infinite while it cannot be measured"""
+
+    def __init__(self, check_seconds=None):
+        if check_seconds is None:
+            check_seconds = float(os.environ.get('DATABASE_REPLICA_CHECK_SECONDS', 1))
+        self.check_seconds = check_seconds
+        self._lag = float('inf')
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def lag_seconds(self, engine):
+        checked_at = self._checked_at
+        if checked_at is not None and time.monotonic() - checked_at < self.check_seconds:
+            return self._lag
+        # One caller measures; the others use the previous value meanwhile
+        if not self._lock.acquire(blocking=checked_at is None):
+            return self._lag
+        try:
+            self._lag = self._measure(engine)
+            self._checked_at = time.monotonic()
+            return self._lag
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def _measure(engine):
+        try:
+            with engine.connect() as conn:
+                if engine.dialect.name != 'postgresql':
+                    conn.execute(text('SELECT 1'))
+                    return 0.0
+                lag = conn.execute(text(
+                    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+                )).scalar()
+                # NULL when the server is not replaying WAL, i.e. not a standby
+                return float(lag or 0.0)
+        except Exception as e:
+            logging.warning(f"Replica lag check failed, reading from the primary: {e}")
+            return float('inf')
+
+
+replica_lag = ReplicaLagMonitor()
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends eligible reads to the replica bind"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._use_replica(clause):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _use_replica(self, clause):
+        if not _replica_reads.get() or REPLICA_BIND not in self._db.engines:
+            return False
+        if self._flushing or self.info.get('wrote'):
+            return False
+        if not isinstance(clause, Select) or clause._for_update_arg is not None:
+            return False
+        if has_request_context() and browser_session.get(_PRIMARY_UNTIL_KEY, 0) > time.time():
+            return False
+        return replica_lag.lag_seconds(self._db.engines[REPLICA_BIND]) <= max_lag_seconds()
+
+
+def init_replica(app):
+    """Register the replica bind before db.init_app, if DATABASE_REPLICA_URL is set"""
+    url = replica_url()
+    if url:
+        app.config.setdefault('SQLALCHEMY_BINDS', {})[REPLICA_BIND] = url
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_write(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _mark_statement_write(orm_execute_state):
+    # Bulk and conditional updates (ride and driver claims) write without flushing
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _pin_writer_to_primary(session):
+    wrote = session.info.pop('wrote', False)
+    if wrote and REPLICA_BIND in session._db.engines and has_request_context():
+        browser_session[_PRIMARY_UNTIL_KEY] = time.time() + max_lag_seconds()
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _clear_write(session):
+    session.info.pop('wrote', None)
@@ -1,13 +1,20 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify, make_response, session
+from flask import abort, render_template, request, redirect, url_for, flash, jsonify, make_response, session
 from flask_login import current_user
 from app import app, db
 from models import User, Ride, Payment
 from replit_auth import require_login, make_replit_blueprint
+from replica import replica_reads
 from services.ride_service import RideService
 from services.payment_service import PaymentService
 from services.receipt_service import ReceiptService
 from services.pricing_service import get_price_estimate
 from services.location_service import LocationService
+from services.async_location_service import AsyncLocationService
+from services.dispatch_queue import dispatch_queue
+from services.dispatch_service import batch_dispatcher
+from services.driver_features import driver_features
+from services.driver_index import driver_index
+from services.location_trace import decode_fix_batch, trace_store
 import json
 import os
 from datetime import datetime
@@ -15,6 +22,12 @@ from datetime import datetime
 # Register auth blueprint
 app.register_blueprint(make_replit_blueprint(), url_prefix="/auth")
 
+# Start periodic batch dispatch when BATCH_DISPATCH_INTERVAL_SECONDS is set,
+# otherwise match each new ride on the background dispatch workers
+batch_dispatcher.start()
+if not batch_dispatcher.enabled:
+    dispatch_queue.start(RideService.assign_driver)
+
 # Make session permanent
 @app.before_request
 def make_session_permanent():
@@ -53,6 +66,7 @@ def setup_profile():
             current_user.is_available = True
         
         db.session.commit()
+        driver_features.sync_driver(current_user)
         flash('Profile setup complete!', 'success')
         
         if role == 'driver':
@@ -70,7 +84,7 @@ def rider_dashboard():
         return redirect(url_for('setup_profile'))
     
     # Get recent rides
-    recent_rides = RideService.get_user_rides(current_user.id, 'rider')[:5]
+    recent_rides = RideService.get_user_rides(current_user.id, 'rider', limit=5)
     
     return render_template('rider_dashboard.html', recent_rides=recent_rides)
 
@@ -83,10 +97,11 @@ def driver_dashboard():
         return redirect(url_for('index'))
     
     # Get recent rides
-    recent_rides = RideService.get_user_rides(current_user.id, 'driver')[:5]
+    recent_rides = RideService.get_user_rides(current_user.id, 'driver', limit=5)
     
-    # Get pending rides (not assigned to any driver yet)
-    pending_rides = Ride.query.filter_by(status='pending', driver_id=None).limit(10).all()
+    # Pending rides nearest to the driver, from the in-memory feed
+    lat, lng, _ = LocationService.get_driver_position(current_user)
+    pending_rides = RideService.get_pending_rides(lat, lng, limit=10)
     
     return render_template('driver_dashboard.html', 
                          recent_rides=recent_rides, 
@@ -110,12 +125,22 @@ def book_ride():
             flash('Please provide both pickup and dropoff addresses.', 'error')
             return render_template('book_ride.html', google_maps_api_key=os.environ.get('GOOGLE_MAPS_API_KEY'))
         
+        # Geocode both ends and route between them concurrently
+        trip = AsyncLocationService.run(
+            AsyncLocationService.plan_trip(pickup_address, dropoff_address)
+        )
+        pickup, dropoff, route = trip['pickup'], trip['dropoff'], trip['route']
+        
         # Create ride
         ride = RideService.create_ride(
             rider_id=current_user.id,
             pickup_address=pickup_address,
             dropoff_address=dropoff_address,
-            notes=notes
+            pickup_coords=(pickup['lat'], pickup['lng']) if pickup else None,
+            dropoff_coords=(dropoff['lat'], dropoff['lng']) if dropoff else None,
+            notes=notes,
+            distance_km=round(route['distance_km'], 2) if route else None,
+            estimated_duration=int(route['duration_minutes']) if route else None
         )
         
         flash(f'Ride booked successfully! Ride ID: {ride.id}', 'success')
@@ -125,6 +150,7 @@ def book_ride():
 
 @app.route('/ride/<int:ride_id>')
 @require_login
+@replica_reads
 def ride_details(ride_id):
     """View ride details"""
     ride = Ride.query.get_or_404(ride_id)
@@ -138,6 +164,22 @@ def ride_details(ride_id):
     
     return render_template('ride_details.html', ride=ride, payment=payment)
 
+@app.route('/api/ride_status/<int:ride_id>')
+@require_login
+@replica_reads
+def api_ride_status(ride_id):
+    """Current status of a ride, polled by the ride page while a driver is being found"""
+    ride = Ride.query.get_or_404(ride_id)
+    
+    if current_user.id not in [ride.rider_id, ride.driver_id]:
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify({
+        'status': ride.status,
+        'driver_id': ride.driver_id,
+        'accepted_at': ride.accepted_at.isoformat() if ride.accepted_at else None
+    })
+
 @app.route('/accept_ride/<int:ride_id>', methods=['POST'])
 @require_login
 def accept_ride(ride_id):
@@ -152,12 +194,14 @@ def accept_ride(ride_id):
         flash('This ride has already been accepted.', 'error')
         return redirect(url_for('driver_dashboard'))
     
-    # Assign driver
-    ride.driver_id = current_user.id
-    ride.status = 'accepted'
-    current_user.is_available = False
+    if not current_user.is_available:
+        flash('You need to be available, and not on another ride, to accept rides.', 'error')
+        return redirect(url_for('driver_dashboard'))
     
-    db.session.commit()
+    # Assign driver; another driver may have taken it since the page loaded
+    if not RideService.accept_ride(ride.id, current_user.id):
+        flash('This ride is no longer available.', 'error')
+        return redirect(url_for('driver_dashboard'))
     
     flash('Ride accepted successfully!', 'success')
     return redirect(url_for('ride_details', ride_id=ride.id))
@@ -210,9 +254,12 @@ def pay_ride(ride_id):
 
 @app.route('/download_receipt/<int:ride_id>')
 @require_login
+@replica_reads
 def download_receipt(ride_id):
     """Download PDF receipt"""
-    ride = Ride.query.get_or_404(ride_id)
+    ride = RideService.get_ride_with_people(ride_id)
+    if not ride:
+        abort(404)
     payment = PaymentService.get_payment_by_ride(ride_id)
     
     # Check permissions
@@ -235,10 +282,13 @@ def download_receipt(ride_id):
 
 @app.route('/ride_history')
 @require_login
+@replica_reads
 def ride_history():
     """View ride history"""
-    rides = RideService.get_user_rides(current_user.id, current_user.role)
-    return render_template('ride_history.html', rides=rides)
+    cursor = request.args.get('before')
+    rides, next_cursor = RideService.get_user_rides_page(current_user.id, current_user.role, cursor=cursor,
+                                                         with_payments=True)
+    return render_template('ride_history.html', rides=rides, next_cursor=next_cursor, is_first_page=not cursor)
 
 @app.route('/toggle_availability', methods=['POST'])
 @require_login
@@ -250,6 +300,8 @@ def toggle_availability():
     
     current_user.is_available = not current_user.is_available
     db.session.commit()
+    driver_index.sync_driver(current_user)
+    driver_features.sync_driver(current_user)
     
     status = 'available' if current_user.is_available else 'unavailable'
     flash(f'You are now {status}.', 'success')
@@ -278,25 +330,14 @@ def api_price_estimate():
     if not pickup_coords or not dropoff_coords:
         return jsonify({'error': 'Both pickup and dropoff coordinates required'}), 400
     
-    # Use Google Maps Distance Matrix API for real distance calculation
-    distance_data = LocationService.calculate_distance_matrix(
-        [pickup_coords], [dropoff_coords]
-    )
+    # Use Google Maps Distance Matrix API (cached and coalesced) for real distance calculation
+    route = LocationService.get_route_metrics(pickup_coords, dropoff_coords)
     
-    if distance_data and distance_data['status'] == 'OK':
-        element = distance_data['rows'][0]['elements'][0]
-        if element['status'] == 'OK':
-            distance_km = element['distance']['value'] / 1000  # Convert meters to km
-            duration_minutes = element['duration']['value'] / 60  # Convert seconds to minutes
-        else:
-            # Fallback to haversine distance if API fails
-            distance_km = LocationService._calculate_haversine_distance(
-                pickup_coords['lat'], pickup_coords['lng'],
-                dropoff_coords['lat'], dropoff_coords['lng']
-            )
-            duration_minutes = max(15, int(distance_km * 2.5))
+    if route:
+        distance_km = route['distance_km']
+        duration_minutes = route['duration_minutes']
     else:
-        # Fallback calculation
+        # Fallback to haversine distance if API fails
         distance_km = LocationService._calculate_haversine_distance(
             pickup_coords['lat'], pickup_coords['lng'],
             dropoff_coords['lat'], dropoff_coords['lng']
@@ -355,6 +396,7 @@ def api_place_details():
 
 @app.route('/api/nearby_drivers', methods=['POST'])
 @require_login
+@replica_reads
 def api_nearby_drivers():
     """Get nearby available drivers"""
     data = request.get_json()
@@ -384,6 +426,33 @@ def api_update_location():
     
     success = LocationService.update_driver_location(current_user.id, lat, lng)
     if success:
+        trace_store.extend(current_user.id, [(lat, lng, datetime.now())])
         return jsonify({'success': True})
     else:
         return jsonify({'error': 'Failed to update location'}), 400
+
+@app.route('/api/update_location/batch', methods=['POST'])
+@require_login
+def api_update_location_batch():
+    """Upload a queue of delta-encoded GPS fixes in one request"""
+    if current_user.role != 'driver':
+        return jsonify({'error': 'Only drivers can update location'}), 403
+    
+    try:
+        fixes = decode_fix_batch(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Never trust the device clock past the server's: a future-dated fix would
+    # outrank every later server-stamped one and pin the driver's freshness
+    now = datetime.now()
+    fixes = [(lat, lng, min(recorded_at, now)) for lat, lng, recorded_at in fixes]
+    
+    # Only the newest fix moves the driver; the full trace is kept for consumers
+    lat, lng, recorded_at = fixes[-1]
+    success = LocationService.update_driver_location(current_user.id, lat, lng, recorded_at)
+    if success:
+        trace_store.extend(current_user.id, fixes)
+        return jsonify({'success': True, 'accepted': len(fixes)})
+    else:
+        return jsonify({'error': 'Failed to update location'}), 400
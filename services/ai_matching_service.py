@@ -1,17 +1,100 @@
 import os
 import json
 import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Tuple
+import numpy as np
 import google.generativeai as genai
+from sqlalchemy import Integer, cast, func
 from app import db
 from models import User, Ride
+from services.driver_features import driver_features
 from services.location_service import LocationService
 
+# Weights of the basic scorer's factors (distance, rating, experience, location freshness)
+DISTANCE_WEIGHT = 0.4
+RATING_WEIGHT = 0.3
+EXPERIENCE_WEIGHT = 0.2
+FRESHNESS_WEIGHT = 0.1
+
+# Most recent rides passed row by row to the AI performance analysis
+AI_ANALYSIS_SAMPLE_SIZE = 50
+
+WEEKDAY_NAMES = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+
+# Best-scored candidates per ride sent to the model in a batched matching prompt
+BATCH_CANDIDATES_PER_RIDE = 8
+
+# Gemini calls run here so a slow model never holds the request past its deadline
+_model_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('AI_MATCH_WORKERS', 8)),
+    thread_name_prefix='ai-match'
+)
+
+
+class MatchingMetrics:
+    """
+    Outcome counts and latency samples for AI driver matching.
+
+    Outcomes are 'ai' (the model's pick was used), 'deadline' (the model
+    missed the deadline), 'error' (the call failed) and 'invalid' (the
+    answer could not be used). Added latency is how long a match waited on
+    the model after the basic pick was already ready.
+    """
+
+    def __init__(self, max_samples=1000):
+        self._lock = threading.Lock()
+        self.outcomes = {'ai': 0, 'deadline': 0, 'error': 0, 'invalid': 0}
+        self._added_ms = deque(maxlen=max_samples)
+        self._model_ms = deque(maxlen=max_samples)
+
+    def record(self, outcome, added_seconds):
+        with self._lock:
+            self.outcomes[outcome] += 1
+            self._added_ms.append(added_seconds * 1000)
+
+    def record_model_latency(self, seconds):
+        with self._lock:
+            self._model_ms.append(seconds * 1000)
+
+    def stats(self):
+        with self._lock:
+            total = sum(self.outcomes.values())
+            added = sorted(self._added_ms)
+            model = sorted(self._model_ms)
+            return {
+                'matches': total,
+                'outcomes': dict(self.outcomes),
+                'ai_win_rate': round(self.outcomes['ai'] / total, 3) if total else 0.0,
+                'added_latency_ms': self._percentiles(added),
+                'model_latency_ms': self._percentiles(model)
+            }
+
+    @staticmethod
+    def _percentiles(samples):
+        if not samples:
+            return {'p50': None, 'p95': None, 'max': None}
+        return {
+            'p50': round(samples[len(samples) // 2], 1),
+            'p95': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 1),
+            'max': round(samples[-1], 1)
+        }
+
+
+matching_metrics = MatchingMetrics()
+
 class AIMatchingService:
     """AI-powered driver matching using Google Gemini 2.0"""
     
-    def __init__(self):
+    def __init__(self, deadline_ms=None):
+        if deadline_ms is None:
+            deadline_ms = float(os.environ.get('AI_MATCH_DEADLINE_MS', 2000))
+        self.deadline_seconds = deadline_ms / 1000
+        
         # Configure Gemini API
         api_key = os.environ.get('GOOGLE_AI_API_KEY')
         if api_key:
@@ -35,72 +118,112 @@ class AIMatchingService:
         if not nearby_drivers:
             return None
         
+        drivers = self._load_drivers(nearby_drivers)
+        
         # Use AI to analyze and rank drivers if available
         if self.model:
-            return self._ai_driver_selection(ride_request, nearby_drivers)
+            return self._ai_driver_selection(ride_request, drivers)
         else:
-            return self._basic_driver_selection(ride_request, nearby_drivers)
+            return self._basic_driver_selection(ride_request, drivers)
+    
+    def _load_drivers(self, nearby_drivers: List[Dict]) -> List[User]:
+        """
+        Load User rows for proximity search results in one query, nearest first
+        """
+        driver_ids = [d['driver_id'] for d in nearby_drivers]
+        users = {u.id: u for u in User.query.filter(User.id.in_(driver_ids)).all()}
+        return [users[driver_id] for driver_id in driver_ids if driver_id in users]
+    
+    def _pickup_distances(self, ride_request: Dict, drivers: List[User]) -> List[float]:
+        """
+        Distance in km from every driver to the pickup point, in one vectorized call
+        """
+        positions = [LocationService.get_driver_position(driver) for driver in drivers]
+        return LocationService.batch_haversine_distances(
+            ride_request['pickup_lat'], ride_request['pickup_lng'],
+            [position[0] for position in positions],
+            [position[1] for position in positions]
+        ).tolist()
     
     def _ai_driver_selection(self, ride_request: Dict, drivers: List[User]) -> Optional[User]:
         """
-        Use Gemini AI to intelligently select the best driver
+        Use Gemini AI to intelligently select the best driver.
+        
+        The basic scorer runs while the model is thinking; if the model has
+        not answered within the matching deadline, or its answer is unusable,
+        the basic pick is returned instead.
         """
+        started = time.monotonic()
         try:
-            # Prepare driver data for AI analysis
-            driver_data = []
-            for driver in drivers:
-                # Get driver's recent performance
-                recent_rides = db.session.query(Ride).filter(
-                    Ride.driver_id == driver.id,
-                    Ride.completed_at >= datetime.now() - timedelta(days=30),
-                    Ride.status == 'completed'
-                ).limit(10).all()
-                
-                # Calculate distance to pickup
-                distance = LocationService._calculate_haversine_distance(
-                    driver.current_lat, driver.current_lng,
-                    ride_request['pickup_lat'], ride_request['pickup_lng']
-                )
-                
-                # Parse vehicle info
-                vehicle_info = json.loads(driver.vehicle_info) if driver.vehicle_info else {}
-                
-                driver_profile = {
-                    'driver_id': driver.id,
-                    'rating': float(driver.rating),
-                    'total_rides': driver.total_rides,
-                    'recent_rides_count': len(recent_rides),
-                    'distance_to_pickup_km': round(distance, 2),
-                    'vehicle_type': vehicle_info.get('type', 'sedan'),
-                    'vehicle_year': vehicle_info.get('year', 2020),
-                    'is_available': driver.is_available,
-                    'location_updated_minutes_ago': self._get_location_freshness(driver),
-                    'acceptance_rate': self._calculate_acceptance_rate(driver)
-                }
-                driver_data.append(driver_profile)
-            
-            # Create AI prompt for driver selection
-            prompt = self._create_matching_prompt(ride_request, driver_data)
-            
-            # Get AI recommendation
-            response = self.model.generate_content(prompt)
-            result = self._parse_ai_response(response.text)
-            
-            if result and 'selected_driver_id' in result:
-                selected_driver = next(
-                    (d for d in drivers if d.id == result['selected_driver_id']), 
-                    None
-                )
-                if selected_driver:
-                    logging.info(f"AI selected driver {selected_driver.id} with reasoning: {result.get('reasoning', 'No reasoning provided')}")
-                    return selected_driver
-            
-            # Fallback to basic selection if AI fails
-            return self._basic_driver_selection(ride_request, drivers)
-            
+            prompt = self._create_matching_prompt(ride_request, self._driver_profiles(ride_request, drivers))
+            future = _model_executor.submit(self._generate, prompt)
         except Exception as e:
             logging.error(f"AI driver selection failed: {e}")
+            matching_metrics.record('error', 0)
             return self._basic_driver_selection(ride_request, drivers)
+        
+        basic_driver = self._basic_driver_selection(ride_request, drivers)
+        basic_ready = time.monotonic()
+        
+        try:
+            response_text = future.result(timeout=max(0, started + self.deadline_seconds - basic_ready))
+        except FutureTimeoutError:
+            future.cancel()
+            matching_metrics.record('deadline', time.monotonic() - basic_ready)
+            logging.warning(f"AI driver selection missed the {self.deadline_seconds:.1f}s deadline; using basic selection")
+            return basic_driver
+        except Exception as e:
+            matching_metrics.record('error', time.monotonic() - basic_ready)
+            logging.error(f"AI driver selection failed: {e}")
+            return basic_driver
+        
+        added_seconds = time.monotonic() - basic_ready
+        result = self._parse_ai_response(response_text)
+        if result and 'selected_driver_id' in result:
+            selected_driver = next(
+                (d for d in drivers if d.id == result['selected_driver_id']), 
+                None
+            )
+            if selected_driver:
+                matching_metrics.record('ai', added_seconds)
+                logging.info(f"AI selected driver {selected_driver.id} with reasoning: {result.get('reasoning', 'No reasoning provided')}")
+                return selected_driver
+        
+        # Fallback to basic selection if the AI answer is unusable
+        matching_metrics.record('invalid', added_seconds)
+        return basic_driver
+    
+    def _driver_profiles(self, ride_request: Dict, drivers: List[User]) -> List[Dict]:
+        """
+        Driver data for the matching prompt, read from the driver feature store
+        """
+        driver_data = []
+        distances = self._pickup_distances(ride_request, drivers)
+        for driver, distance, features in zip(drivers, distances, driver_features.features_many(drivers)):
+            driver_profile = {
+                'driver_id': driver.id,
+                'rating': features['rating'],
+                'total_rides': features['total_rides'],
+                'recent_rides_count': features['recent_rides_count'],
+                'distance_to_pickup_km': round(distance, 2),
+                'vehicle_type': features['vehicle_type'],
+                'vehicle_year': features['vehicle_year'],
+                'is_available': features['is_available'],
+                'location_updated_minutes_ago': self._minutes_ago(features),
+                'acceptance_rate': features['acceptance_rate']
+            }
+            driver_data.append(driver_profile)
+        return driver_data
+    
+    def _generate(self, prompt: str) -> str:
+        """
+        Blocking model call, run on the matching executor
+        """
+        started = time.monotonic()
+        try:
+            return self.model.generate_content(prompt).text
+        finally:
+            matching_metrics.record_model_latency(time.monotonic() - started)
     
     def _create_matching_prompt(self, ride_request: Dict, driver_data: List[Dict]) -> str:
         """
@@ -167,61 +290,264 @@ Respond only with the JSON object, no additional text.
             logging.error(f"Failed to parse AI response: {e}")
             return None
     
+    def find_optimal_drivers(self, ride_requests: List[Dict], candidates: Optional[List[List[User]]] = None,
+                             fill: bool = True) -> List[Optional[User]]:
+        """
+        Find drivers for several ride requests with a single model call.
+        Returns one driver (or None) per request, in order; no driver is
+        picked for more than one ride. `candidates` optionally gives each
+        ride's drivers, best first (the batch dispatcher passes the drivers
+        it has locked); by default they are the nearby drivers. With
+        fill=False, rides the model leaves unanswered stay None instead of
+        getting their best free candidate.
+        """
+        if candidates is None:
+            candidates = self._nearby_candidates(ride_requests)
+        else:
+            candidates = [ride_candidates[:BATCH_CANDIDATES_PER_RIDE] for ride_candidates in candidates]
+        
+        if not self.model or not any(candidates):
+            picks = [None] * len(ride_requests)
+        else:
+            picks = self._ai_batch_selection(ride_requests, candidates)
+        return self._assign_distinct(candidates, picks) if fill else picks
+    
+    def _nearby_candidates(self, ride_requests: List[Dict]) -> List[List[User]]:
+        """Each ride's best-ranked drivers within 15 km of its pickup"""
+        nearby = [
+            LocationService.find_nearby_drivers(r['pickup_lat'], r['pickup_lng'], radius_km=15)
+            for r in ride_requests
+        ]
+        driver_ids = list({d['driver_id'] for drivers in nearby for d in drivers})
+        users = {u.id: u for u in User.query.filter(User.id.in_(driver_ids)).all()} if driver_ids else {}
+        
+        # Pre-rank each ride's candidates so the prompt only carries the plausible ones
+        return [
+            [driver for driver, score, distance in self.rank_drivers(
+                ride_request,
+                [users[d['driver_id']] for d in drivers if d['driver_id'] in users],
+                k=BATCH_CANDIDATES_PER_RIDE
+            )]
+            for ride_request, drivers in zip(ride_requests, nearby)
+        ]
+    
+    def _ai_batch_selection(self, ride_requests: List[Dict], candidates: List[List[User]]) -> List[Optional[User]]:
+        """
+        One Gemini call ranks drivers for every ride, under the same deadline
+        as single-ride matching. Rides the model leaves unanswered, or
+        answers with an unknown or already-taken driver, get None, as do
+        all rides when the call fails or misses the deadline.
+        """
+        started = time.monotonic()
+        labels = {}  # driver id -> short label used in the prompt
+        aliases = {}  # short label -> driver
+        for ride_candidates in candidates:
+            for driver in ride_candidates:
+                if driver.id not in labels:
+                    labels[driver.id] = f"D{len(labels) + 1}"
+                    aliases[labels[driver.id]] = driver
+        
+        fallback = [None] * len(ride_requests)
+        try:
+            prompt = self._create_batch_matching_prompt(ride_requests, candidates, labels)
+            future = _model_executor.submit(self._generate, prompt)
+        except Exception as e:
+            logging.error(f"AI batch driver selection failed: {e}")
+            for _ in ride_requests:
+                matching_metrics.record('error', 0)
+            return fallback
+        basic_ready = time.monotonic()
+        
+        try:
+            response_text = future.result(timeout=max(0, started + self.deadline_seconds - basic_ready))
+        except FutureTimeoutError:
+            future.cancel()
+            for _ in ride_requests:
+                matching_metrics.record('deadline', time.monotonic() - basic_ready)
+            logging.warning(f"AI batch driver selection missed the {self.deadline_seconds:.1f}s deadline; using basic selection")
+            return fallback
+        except Exception as e:
+            for _ in ride_requests:
+                matching_metrics.record('error', time.monotonic() - basic_ready)
+            logging.error(f"AI batch driver selection failed: {e}")
+            return fallback
+        
+        added_seconds = time.monotonic() - basic_ready
+        answers = self._parse_batch_response(response_text)
+        picks = [None] * len(ride_requests)
+        taken = set()
+        for i, ride_candidates in enumerate(candidates):
+            driver = aliases.get(answers.get(f"R{i + 1}"))
+            if driver is not None and driver in ride_candidates and driver.id not in taken:
+                picks[i] = driver
+                taken.add(driver.id)
+                matching_metrics.record('ai', added_seconds)
+            else:
+                matching_metrics.record('invalid', added_seconds)
+        
+        return picks
+    
+    @staticmethod
+    def _assign_distinct(candidates: List[List[User]], picks: List[Optional[User]]) -> List[Optional[User]]:
+        """
+        Fill rides without a pick with their best-ranked candidate not taken by an earlier ride
+        """
+        taken = {driver.id for driver in picks if driver is not None}
+        picks = list(picks)
+        for i, ride_candidates in enumerate(candidates):
+            if picks[i] is None:
+                picks[i] = next((d for d in ride_candidates if d.id not in taken), None)
+                if picks[i] is not None:
+                    taken.add(picks[i].id)
+        return picks
+    
+    def _create_batch_matching_prompt(self, ride_requests: List[Dict], candidates: List[List[User]],
+                                      labels: Dict[str, str]) -> str:
+        """
+        Prompt ranking drivers for several rides at once. Rides and
+        candidates are pipe-separated tables with short R/D labels instead
+        of JSON objects, which keeps the token count close to the data size.
+        """
+        ride_rows = []
+        for i, r in enumerate(ride_requests):
+            ride_rows.append('|'.join([
+                f"R{i + 1}",
+                f"{r['pickup_lat']:.4f},{r['pickup_lng']:.4f}",
+                f"{r['dropoff_lat']:.4f},{r['dropoff_lng']:.4f}" if r.get('dropoff_lat') is not None else '-',
+                str(r.get('distance_km') or '-'),
+                ' '.join(str(r.get('notes') or '-').split())[:80]
+            ]))
+        
+        candidate_rows = []
+        for i, (r, ride_candidates) in enumerate(zip(ride_requests, candidates)):
+            distances = self._pickup_distances(r, ride_candidates)
+            features = driver_features.features_many(ride_candidates)
+            for driver, distance, f in zip(ride_candidates, distances, features):
+                candidate_rows.append('|'.join([
+                    f"R{i + 1}",
+                    labels[driver.id],
+                    f"{distance:.2f}",
+                    f"{f['rating']:.1f}",
+                    str(f['total_rides']),
+                    str(f['recent_rides_count']),
+                    f"{f['acceptance_rate']:.2f}",
+                    str(self._minutes_ago(f)),
+                    f"{f['vehicle_type']}/{f['vehicle_year']}"
+                ]))
+        
+        rides_table = '\n'.join(ride_rows)
+        candidates_table = '\n'.join(candidate_rows)
+        return f"""You match ride requests to drivers for a ride-sharing platform. Time: {datetime.now().strftime('%H:%M %A')}.
+
+RIDES (ride|pickup lat,lng|dropoff lat,lng|trip km|notes)
+{rides_table}
+
+CANDIDATES (ride|driver|pickup km|rating|total rides|rides last 30d|acceptance rate|location age min|vehicle/year)
+{candidates_table}
+
+Pick one driver per ride from that ride's candidates. Use each driver at most once. Prefer short pickups, fresh locations, high rating and acceptance rate, and a vehicle suited to the trip; minimize total rider wait across all rides.
+
+Respond only with a JSON object mapping ride to driver, e.g. {{"R1": "D3", "R2": "D1"}}. Omit rides with no suitable driver."""
+    
+    def _parse_batch_response(self, response_text: str) -> Dict[str, str]:
+        """
+        Ride label -> driver label from a batched answer; accepts a flat
+        mapping or a list of {"ride", "driver"} objects
+        """
+        result = self._parse_ai_response(response_text)
+        if isinstance(result, dict) and isinstance(result.get('assignments'), (dict, list)):
+            result = result['assignments']
+        if isinstance(result, list):
+            result = {
+                item.get('ride'): item.get('driver')
+                for item in result if isinstance(item, dict)
+            }
+        if not isinstance(result, dict):
+            return {}
+        return {str(ride): str(driver) for ride, driver in result.items() if ride and driver}
+    
     def _basic_driver_selection(self, ride_request: Dict, drivers: List[User]) -> Optional[User]:
         """
         Fallback basic driver selection algorithm
         """
-        if not drivers:
+        ranked = self.rank_drivers(ride_request, drivers, k=1)
+        if not ranked:
             return None
         
-        # Score drivers based on multiple factors
-        scored_drivers = []
+        driver, score, distance = ranked[0]
+        logging.info(f"Basic algorithm selected driver {driver.id} with score {score:.2f}")
+        return driver
+    
+    def rank_drivers(self, ride_request: Dict, drivers: List[User], k: int = 5) -> List[Tuple[User, float, float]]:
+        """
+        Top k available drivers by basic score as (driver, score, distance_km),
+        best first. Later entries are backups to offer the ride to without
+        re-scoring.
+        """
+        if not drivers or k <= 0:
+            return []
         
-        for driver in drivers:
-            distance = LocationService._calculate_haversine_distance(
-                driver.current_lat, driver.current_lng,
-                ride_request['pickup_lat'], ride_request['pickup_lng']
-            )
-            
-            # Calculate composite score
-            distance_score = max(0, 10 - distance)  # Closer is better
-            rating_score = driver.rating  # 1-5 scale
-            experience_score = min(5, driver.total_rides / 20)  # Up to 5 points for experience
-            freshness_score = self._get_location_freshness_score(driver)
-            
-            total_score = (distance_score * 0.4 + 
-                          rating_score * 0.3 + 
-                          experience_score * 0.2 + 
-                          freshness_score * 0.1)
-            
-            scored_drivers.append((driver, total_score, distance))
+        # Availability comes from the rows just loaded: the feature store only
+        # refreshes every few minutes and would lag changes made by other workers
+        candidates = np.flatnonzero([bool(driver.is_available) for driver in drivers])
+        columns = driver_features.columns(drivers)
+        if not candidates.size:
+            return []
+        
+        candidate_drivers = [drivers[i] for i in candidates]
+        distances = np.asarray(self._pickup_distances(ride_request, candidate_drivers))
         
-        # Sort by score (highest first)
-        scored_drivers.sort(key=lambda x: x[1], reverse=True)
+        # Composite score: closer, better rated, more experienced and fresher is better
+        distance_score = np.maximum(0, 10 - distances)
+        rating_score = columns['rating'][candidates]  # 1-5 scale
+        experience_score = np.minimum(5, columns['total_rides'][candidates] / 20)  # Up to 5 points for experience
+        freshness_score = self._freshness_scores(columns['location_age_minutes'][candidates])
         
-        # Return the highest scoring available driver
-        for driver, score, distance in scored_drivers:
-            if driver.is_available:
-                logging.info(f"Basic algorithm selected driver {driver.id} with score {score:.2f}")
-                return driver
+        scores = (distance_score * DISTANCE_WEIGHT + 
+                  rating_score * RATING_WEIGHT + 
+                  experience_score * EXPERIENCE_WEIGHT + 
+                  freshness_score * FRESHNESS_WEIGHT)
         
-        return None
+        # Partial selection of the best k, then order just those
+        k = min(k, scores.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(candidate_drivers[i], float(scores[i]), float(distances[i])) for i in top]
+    
+    @staticmethod
+    def _minutes_ago(features: Dict) -> int:
+        """
+        How many minutes ago the driver's location was updated
+        """
+        minutes = features['location_age_minutes']
+        return 999 if minutes is None else minutes  # 999 = very stale
     
     def _get_location_freshness(self, driver: User) -> int:
         """
         Get how many minutes ago the driver's location was updated
         """
-        if not driver.location_updated_at:
-            return 999  # Very stale
-        
-        delta = datetime.now() - driver.location_updated_at
-        return int(delta.total_seconds() / 60)
+        return self._minutes_ago(driver_features.features(driver))
     
     def _get_location_freshness_score(self, driver: User) -> float:
         """
         Score location freshness (0-5 scale)
         """
-        minutes_ago = self._get_location_freshness(driver)
+        return self._freshness_score(self._get_location_freshness(driver))
+    
+    @staticmethod
+    def _freshness_scores(minutes_ago: np.ndarray) -> np.ndarray:
+        """
+        Vectorized _freshness_score; NaN (never updated) scores 0
+        """
+        minutes_ago = np.floor(minutes_ago)
+        return np.select(
+            [minutes_ago <= 2, minutes_ago <= 5, minutes_ago <= 10, minutes_ago <= 30, minutes_ago <= 60],
+            [5.0, 4.0, 3.0, 2.0, 1.0],
+            default=0.0
+        )
+    
+    @staticmethod
+    def _freshness_score(minutes_ago: int) -> float:
         if minutes_ago <= 2:
             return 5.0
         elif minutes_ago <= 5:
@@ -237,80 +563,158 @@ Respond only with the JSON object, no additional text.
     
     def _calculate_acceptance_rate(self, driver: User) -> float:
         """
-        Calculate driver's acceptance rate for recent ride requests
+        Driver's acceptance rate over resolved ride offers, smoothed toward a prior
         """
-        # This would require tracking ride request offers vs acceptances
-        # For now, use a mock calculation based on rating and total rides
-        base_rate = min(0.95, driver.rating / 5.0 * 0.9)
-        experience_bonus = min(0.1, driver.total_rides / 100 * 0.1)
-        return round(base_rate + experience_bonus, 2)
+        return driver_features.features(driver)['acceptance_rate']
     
     def analyze_matching_performance(self, time_period_days: int = 30) -> Dict:
         """
-        Analyze the performance of the AI matching system
+        Analyze the performance of the AI matching system.
+        All aggregation runs in the database, so memory use does not grow
+        with the number of rides in the period.
         """
         try:
-            # Get recent completed rides
-            recent_rides = db.session.query(Ride).filter(
-                Ride.completed_at >= datetime.now() - timedelta(days=time_period_days),
-                Ride.status == 'completed'
-            ).all()
+            since = datetime.now() - timedelta(days=time_period_days)
+            buckets = self._performance_buckets(since)
             
-            if not recent_rides:
+            if not buckets:
                 return {"error": "No completed rides in the specified period"}
             
-            # Calculate metrics
-            total_rides = len(recent_rides)
-            avg_pickup_time = sum(
-                (ride.accepted_at - ride.requested_at).total_seconds() / 60 
-                for ride in recent_rides if ride.accepted_at
-            ) / total_rides
+            # Roll the (weekday, hour) buckets up into totals and both breakdowns
+            total_rides = sum(b['rides'] for b in buckets)
+            summary = self._summarize_buckets(buckets)
+            by_hour = {}
+            by_weekday = {}
+            for b in buckets:
+                by_hour.setdefault(b['hour'], []).append(b)
+                by_weekday.setdefault(b['weekday'], []).append(b)
             
-            avg_rating = sum(ride.driver.rating for ride in recent_rides) / total_rides
+            result = {
+                "total_rides": total_rides,
+                "average_pickup_time_minutes": summary['average_pickup_time_minutes'],
+                "average_driver_rating": summary['average_driver_rating'],
+                "by_hour_of_day": {hour: self._summarize_buckets(by_hour[hour]) for hour in sorted(by_hour)},
+                "by_day_of_week": {
+                    WEEKDAY_NAMES[day]: self._summarize_buckets(by_weekday[day]) for day in sorted(by_weekday)
+                }
+            }
             
             # Use AI to analyze patterns if available
             if self.model:
-                return self._ai_performance_analysis(recent_rides, avg_pickup_time, avg_rating)
+                return self._ai_performance_analysis(result, self._recent_ride_sample(since))
             else:
-                return {
-                    "total_rides": total_rides,
-                    "average_pickup_time_minutes": round(avg_pickup_time, 2),
-                    "average_driver_rating": round(avg_rating, 2),
-                    "analysis_method": "basic"
-                }
+                result["analysis_method"] = "basic"
+                return result
                 
         except Exception as e:
             logging.error(f"Performance analysis failed: {e}")
             return {"error": str(e)}
     
-    def _ai_performance_analysis(self, rides: List[Ride], avg_pickup_time: float, avg_rating: float) -> Dict:
+    def _performance_buckets(self, since: datetime) -> List[Dict]:
+        """
+        Completed rides since `since` grouped by (weekday, hour) in one
+        query: at most 168 rows of counts and sums, whatever the period
+        """
+        hour, weekday = self._hour_and_weekday(Ride.requested_at)
+        pickup_minutes = self._minutes_between(Ride.requested_at, Ride.accepted_at)
+        rows = db.session.query(
+            weekday.label('weekday'),
+            hour.label('hour'),
+            func.count(Ride.id),
+            func.count(Ride.accepted_at),
+            func.sum(pickup_minutes),
+            func.count(User.rating),
+            func.sum(User.rating),
+            func.avg(Ride.distance_km),
+            func.avg(Ride.price)
+        ).outerjoin(User, User.id == Ride.driver_id).filter(
+            Ride.completed_at >= since,
+            Ride.status == 'completed'
+        ).group_by(weekday, hour).all()
+        
+        return [{
+            'weekday': int(row[0]),
+            'hour': int(row[1]),
+            'rides': row[2],
+            'accepted': row[3],
+            'pickup_minutes_sum': float(row[4] or 0),
+            'rated': row[5],
+            'rating_sum': float(row[6] or 0),
+            'distance_km_avg': float(row[7] or 0),
+            'price_avg': float(row[8] or 0)
+        } for row in rows]
+    
+    @staticmethod
+    def _summarize_buckets(buckets: List[Dict]) -> Dict:
+        rides = sum(b['rides'] for b in buckets)
+        accepted = sum(b['accepted'] for b in buckets)
+        rated = sum(b['rated'] for b in buckets)
+        return {
+            'rides': rides,
+            'average_pickup_time_minutes': round(sum(b['pickup_minutes_sum'] for b in buckets) / accepted, 2) if accepted else None,
+            'average_driver_rating': round(sum(b['rating_sum'] for b in buckets) / rated, 2) if rated else None,
+            'average_distance_km': round(sum(b['distance_km_avg'] * b['rides'] for b in buckets) / rides, 2),
+            'average_price': round(sum(b['price_avg'] * b['rides'] for b in buckets) / rides, 2)
+        }
+    
+    def _recent_ride_sample(self, since: datetime, limit: int = AI_ANALYSIS_SAMPLE_SIZE) -> List[Dict]:
+        """
+        The most recent completed rides as plain rows for the AI prompt
+        """
+        rows = db.session.query(
+            Ride.requested_at, Ride.accepted_at, Ride.distance_km, Ride.price, User.rating
+        ).outerjoin(User, User.id == Ride.driver_id).filter(
+            Ride.completed_at >= since,
+            Ride.status == 'completed'
+        ).order_by(Ride.completed_at.desc()).limit(limit).all()
+        
+        return [{
+            'pickup_time_minutes': round((accepted_at - requested_at).total_seconds() / 60, 1) if accepted_at else None,
+            'driver_rating': rating,
+            'distance_km': distance_km,
+            'price': price,
+            'day_of_week': requested_at.strftime('%A'),
+            'hour_of_day': requested_at.hour
+        } for requested_at, accepted_at, distance_km, price, rating in rows]
+    
+    @staticmethod
+    def _hour_and_weekday(column):
+        """SQL expressions for the hour (0-23) and weekday (0 = Sunday) of a timestamp column"""
+        if db.engine.dialect.name == 'postgresql':
+            return func.extract('hour', column), func.extract('dow', column)
+        return (
+            cast(func.strftime('%H', column), Integer),
+            cast(func.strftime('%w', column), Integer)
+        )
+    
+    @staticmethod
+    def _minutes_between(start, end):
+        """SQL expression for the minutes from start to end"""
+        if db.engine.dialect.name == 'postgresql':
+            return func.extract('epoch', end - start) / 60
+        return (func.julianday(end) - func.julianday(start)) * 1440
+    
+    def _ai_performance_analysis(self, summary: Dict, sample: List[Dict]) -> Dict:
         """
         Use AI to analyze matching performance and provide insights
         """
         try:
-            # Prepare data for AI analysis
-            ride_data = []
-            for ride in rides[:50]:  # Limit to recent 50 rides for analysis
-                pickup_time = (ride.accepted_at - ride.requested_at).total_seconds() / 60 if ride.accepted_at else None
-                ride_data.append({
-                    'pickup_time_minutes': pickup_time,
-                    'driver_rating': ride.driver.rating,
-                    'distance_km': ride.distance_km,
-                    'price': ride.price,
-                    'day_of_week': ride.requested_at.strftime('%A'),
-                    'hour_of_day': ride.requested_at.hour
-                })
-            
             prompt = f"""
 Analyze the following ride-sharing matching performance data and provide insights:
 
 SUMMARY METRICS:
-- Total rides analyzed: {len(rides)}
-- Average pickup time: {avg_pickup_time:.2f} minutes
-- Average driver rating: {avg_rating:.2f}
+- Total rides analyzed: {summary['total_rides']}
+- Average pickup time: {summary['average_pickup_time_minutes']} minutes
+- Average driver rating: {summary['average_driver_rating']}
 
-DETAILED RIDE DATA:
-{json.dumps(ride_data, indent=2, default=str)}
+BY HOUR OF DAY:
+{json.dumps(summary['by_hour_of_day'], default=str)}
+
+BY DAY OF WEEK:
+{json.dumps(summary['by_day_of_week'], default=str)}
+
+MOST RECENT RIDES (sample of {len(sample)}):
+{json.dumps(sample, default=str)}
 
 Please provide analysis in JSON format:
 {{
@@ -338,16 +742,12 @@ Respond only with the JSON object.
             result = self._parse_ai_response(response.text)
             
             if result:
-                result.update({
-                    "total_rides": len(rides),
-                    "average_pickup_time_minutes": round(avg_pickup_time, 2),
-                    "average_driver_rating": round(avg_rating, 2),
-                    "analysis_method": "ai_powered"
-                })
+                result.update(summary)
+                result["analysis_method"] = "ai_powered"
                 return result
             else:
                 return {"error": "Failed to parse AI analysis"}
                 
         except Exception as e:
             logging.error(f"AI performance analysis failed: {e}")
-            return {"error": str(e)}
\ No newline at end of file
+            return {"error": str(e)}
@@ -0,0 +1,196 @@
+import asyncio
+import threading
+import time
+from services.http_client import AsyncPooledHTTPClient, google_maps_client
+from services.location_cache import MISS
+from services.location_service import (
+    AUTOCOMPLETE_URL,
+    DISTANCE_MATRIX_URL,
+    GEOCODE_URL,
+    PLACE_DETAILS_URL,
+    LocationService,
+    autocomplete_cache,
+    geocode_cache,
+    place_details_cache,
+)
+
+async_maps_client = AsyncPooledHTTPClient(google_maps_client)
+
+# Slack past a lookup deadline before plan_trip cancels lookups that overran it
+_DEADLINE_GRACE_SECONDS = 0.5
+
+
+class _EventLoopThread:
+    """
+    One long-lived event loop per process, running on a daemon thread.
+
+    Sync Flask views hand coroutines to it and block on the result, so all
+    outbound lookups of a request run concurrently over the loop's shared
+    connection pool instead of tying up a thread per call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop())
+
+    def _get_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='location-async', daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+
+_loop_thread = _EventLoopThread()
+
+
+class AsyncLocationService:
+    """
+    asyncio version of the LocationService Google Maps lookups.
+
+    Methods share LocationService's caches, response parsing and circuit
+    breakers, and return the same shapes. Use `run()` to call them from
+    sync code such as Flask views. Reads and writes of the SQLite-backed
+    caches run in the loop's default executor so disk I/O never blocks
+    the event loop; the autocomplete cache is in memory and is used inline.
+    """
+
+    @staticmethod
+    def run(coro, timeout=20):
+        """Run a coroutine on the shared event loop and wait for its result"""
+        return _loop_thread.submit(coro).result(timeout)
+
+    @staticmethod
+    async def geocode_address(address, deadline=None):
+        """
+        Geocode an address using Google Maps API, served from geocode_cache
+        when possible. `deadline` (time.monotonic()) bounds the call and its retries.
+        """
+        api_key = LocationService.get_google_maps_api_key()
+        if not api_key:
+            return None
+
+        cache_key = LocationService.normalize_address(address)
+        cached = await asyncio.to_thread(geocode_cache.get, cache_key)
+        if cached is not MISS:
+            return cached
+
+        params = {
+            'address': address,
+            'key': api_key
+        }
+
+        try:
+            data = await async_maps_client.get_json('geocode', GEOCODE_URL, params, deadline=deadline)
+            return await asyncio.to_thread(LocationService._geocode_result, data, cache_key)
+        except Exception as e:
+            print(f"Geocoding error: {e}")
+
+        return None
+
+    @staticmethod
+    async def calculate_distance_matrix(origins, destinations, deadline=None):
+        """Calculate distance and duration between origins and destinations, finishing by `deadline`"""
+        api_key = LocationService.get_google_maps_api_key()
+        if not api_key:
+            return None
+
+        params = LocationService._distance_matrix_params(origins, destinations, api_key)
+
+        try:
+            data = await async_maps_client.get_json('distance_matrix', DISTANCE_MATRIX_URL, params, deadline=deadline)
+            if data['status'] == 'OK':
+                return data
+        except Exception as e:
+            print(f"Distance matrix error: {e}")
+
+        return None
+
+    @staticmethod
+    async def get_place_autocomplete(input_text, location=None):
+        """Get place autocomplete suggestions from Google Places API"""
+        api_key = LocationService.get_google_maps_api_key()
+        if not api_key:
+            return []
+
+        cached = autocomplete_cache.lookup(input_text, location)
+        if cached is not None:
+            return cached
+
+        params = {
+            'input': input_text,
+            'key': api_key,
+            'types': 'establishment|geocode'
+        }
+        if location:
+            params['location'] = f"{location['lat']},{location['lng']}"
+            params['radius'] = 50000  # 50km radius
+
+        try:
+            data = await async_maps_client.get_json('autocomplete', AUTOCOMPLETE_URL, params)
+            return LocationService._autocomplete_result(data, input_text, location)
+        except Exception as e:
+            print(f"Autocomplete error: {e}")
+
+        return []
+
+    @staticmethod
+    async def get_place_details(place_id):
+        """Get detailed information about a place using place_id"""
+        api_key = LocationService.get_google_maps_api_key()
+        if not api_key:
+            return None
+
+        cached = await asyncio.to_thread(place_details_cache.get, place_id)
+        if cached is not MISS:
+            return cached
+
+        params = {
+            'place_id': place_id,
+            'fields': 'geometry,formatted_address,name',
+            'key': api_key
+        }
+
+        try:
+            data = await async_maps_client.get_json('place_details', PLACE_DETAILS_URL, params)
+            return await asyncio.to_thread(LocationService._place_details_result, data, place_id)
+        except Exception as e:
+            print(f"Place details error: {e}")
+
+        return None
+
+    @staticmethod
+    async def plan_trip(pickup_address, dropoff_address, timeout=10):
+        """
+        Geocode both addresses and fetch the driving route at the same time.
+        The route is requested by address, so it does not wait for the
+        geocodes and the whole lookup takes about as long as the slowest
+        call. Returns {'pickup', 'dropoff', 'route'}; any part may be None,
+        and all are None if the lookups take longer than `timeout` seconds.
+        Each lookup cuts its attempts and retries to end within `timeout`;
+        the wait_for is only a backstop.
+        """
+        deadline = time.monotonic() + timeout
+        try:
+            pickup, dropoff, matrix = await asyncio.wait_for(asyncio.gather(
+                AsyncLocationService.geocode_address(pickup_address, deadline),
+                AsyncLocationService.geocode_address(dropoff_address, deadline),
+                AsyncLocationService.calculate_distance_matrix([pickup_address], [dropoff_address], deadline)
+            ), timeout + _DEADLINE_GRACE_SECONDS)
+        except asyncio.TimeoutError:
+            print(f"Trip planning timed out after {timeout}s")
+            return {'pickup': None, 'dropoff': None, 'route': None}
+
+        route = None
+        if matrix:
+            element = matrix['rows'][0]['elements'][0]
+            if element.get('status') == 'OK':
+                route = LocationService._route_metrics(element)
+                if pickup and dropoff:
+                    await asyncio.to_thread(LocationService._cache_route_element, pickup, dropoff, element)
+
+        return {'pickup': pickup, 'dropoff': dropoff, 'route': route}
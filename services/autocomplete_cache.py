@@ -0,0 +1,152 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Places Autocomplete returns at most this many predictions per request
+API_MAX_PREDICTIONS = 5
+
+# A truncated (full) cached result may only answer a longer prefix locally if
+# filtering keeps at least this many predictions
+MIN_LOCAL_MATCHES = 3
+
+_WORD_RE = re.compile(r'[\w]+', re.UNICODE)
+
+
+class _TrieNode:
+    __slots__ = ('children', 'entry')
+
+    def __init__(self):
+        self.children = {}
+        self.entry = None  # (predictions, stored_at)
+
+
+class AutocompleteCache:
+    """
+    Recent Places Autocomplete predictions in a prefix trie per coarse
+    location bucket.
+
+    A lookup for "penn sta" first looks for an exact cached prefix, then
+    falls back to the longest cached shorter prefix ("penn st") and filters
+    its predictions locally. The filtered answer is only trusted when the
+    shorter prefix's result was complete (fewer than the API maximum) or
+    still leaves enough matches; otherwise the caller should go to the API.
+    """
+
+    def __init__(self, max_entries=None, ttl_seconds=None, bucket_deg=None):
+        self.max_entries = max_entries or int(os.environ.get('AUTOCOMPLETE_CACHE_MAX_ENTRIES', 20000))
+        self.ttl_seconds = ttl_seconds or int(os.environ.get('AUTOCOMPLETE_CACHE_TTL_SECONDS', 3600))
+        # Location bias uses a 50 km radius, so ~0.5 degree buckets share results
+        self.bucket_deg = bucket_deg or float(os.environ.get('AUTOCOMPLETE_BUCKET_DEG', 0.5))
+
+        self.exact_hits = 0
+        self.prefix_hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._roots = {}  # bucket -> _TrieNode
+        self._lru = OrderedDict()  # (bucket, prefix) -> None, oldest first
+
+    def lookup(self, input_text, location=None):
+        """Cached or locally filtered predictions, or None when the API must be called"""
+        query = self.normalize(input_text)
+        bucket = self._bucket(location)
+        now = time.time()
+
+        with self._lock:
+            node = self._roots.get(bucket)
+            best = None  # (prefix, predictions)
+            depth = 0
+            while node is not None:
+                if node.entry is not None and now - node.entry[1] < self.ttl_seconds:
+                    best = (query[:depth], node.entry[0])
+                if depth == len(query):
+                    break
+                node = node.children.get(query[depth])
+                depth += 1
+
+            if best is None:
+                self.misses += 1
+                return None
+
+            prefix, predictions = best
+            self._lru.move_to_end((bucket, prefix))
+            if prefix == query:
+                self.exact_hits += 1
+                return list(predictions)
+
+            matches = [p for p in predictions if self._matches(query, p)]
+            complete = len(predictions) < API_MAX_PREDICTIONS
+            if complete or len(matches) >= MIN_LOCAL_MATCHES:
+                self.prefix_hits += 1
+                return matches
+
+            self.misses += 1
+            return None
+
+    def store(self, input_text, location, predictions):
+        """Remember the API's predictions for this input and location bucket"""
+        query = self.normalize(input_text)
+        bucket = self._bucket(location)
+
+        with self._lock:
+            node = self._roots.setdefault(bucket, _TrieNode())
+            for char in query:
+                node = node.children.setdefault(char, _TrieNode())
+            node.entry = (list(predictions), time.time())
+
+            key = (bucket, query)
+            self._lru[key] = None
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._evict(*self._lru.popitem(last=False)[0])
+
+    def stats(self):
+        lookups = self.exact_hits + self.prefix_hits + self.misses
+        return {
+            'exact_hits': self.exact_hits,
+            'prefix_hits': self.prefix_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.exact_hits + self.prefix_hits) / lookups, 3) if lookups else 0.0,
+            'entries': len(self._lru)
+        }
+
+    @staticmethod
+    def normalize(text):
+        return re.sub(r'\s+', ' ', text.lower()).lstrip()
+
+    def _bucket(self, location):
+        if not location:
+            return None
+        return (round(location['lat'] / self.bucket_deg), round(location['lng'] / self.bucket_deg))
+
+    @staticmethod
+    def _matches(query, prediction):
+        """Every typed word must start some word of the prediction"""
+        words = _WORD_RE.findall(prediction['description'].lower())
+        return all(
+            any(word.startswith(typed) for word in words)
+            for typed in _WORD_RE.findall(query)
+        )
+
+    def _evict(self, bucket, prefix):
+        root = self._roots.get(bucket)
+        if root is None:
+            return
+        path = [root]
+        for char in prefix:
+            child = path[-1].children.get(char)
+            if child is None:
+                return
+            path.append(child)
+        path[-1].entry = None
+
+        # Prune nodes that no longer lead to any entry
+        for depth in range(len(prefix), 0, -1):
+            node = path[depth]
+            if node.entry is not None or node.children:
+                break
+            del path[depth - 1].children[prefix[depth - 1]]
+        if root.entry is None and not root.children:
+            del self._roots[bucket]
@@ -0,0 +1,104 @@
+import logging
+import os
+import queue
+import threading
+from app import app, db
+from models import Ride
+
+
+class DispatchQueue:
+    """
+    Background worker pool that assigns drivers to newly created rides.
+
+    Booking only stores the ride and queues its id, so the request does not
+    wait for matching. The rides table is the durable record: a sweeper
+    re-queues every pending, unassigned ride when the pool starts and then
+    every `retry_seconds`, which recovers rides queued before a restart and
+    retries rides that found no driver. Claims are conditional updates, so
+    several processes sweeping the same ride cannot double-assign it.
+    """
+
+    def __init__(self, workers=None, retry_seconds=None, sweep_limit=500):
+        if workers is None:
+            workers = int(os.environ.get('DISPATCH_WORKERS', 4))
+        if retry_seconds is None:
+            retry_seconds = float(os.environ.get('DISPATCH_RETRY_SECONDS', 15))
+        self.workers = workers
+        self.retry_seconds = retry_seconds
+        self.sweep_limit = sweep_limit
+
+        self._assign = None
+        self._queue = queue.Queue()
+        self._queued = set()  # ride ids waiting or being matched
+        self._queued_lock = threading.Lock()
+        self._threads = []
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return bool(self._threads)
+
+    def submit(self, ride_id):
+        """Queue a ride for matching; ignored if it is already queued"""
+        with self._queued_lock:
+            if ride_id in self._queued:
+                return
+            self._queued.add(ride_id)
+        self._queue.put(ride_id)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def start(self, assign):
+        """Start the workers and sweeper; assign(ride_id) does the matching"""
+        if self.workers <= 0 or self._threads:
+            return
+        self._assign = assign
+        for i in range(self.workers):
+            self._threads.append(threading.Thread(target=self._work, name=f'dispatch-worker-{i}', daemon=True))
+        self._threads.append(threading.Thread(target=self._sweep, name='dispatch-sweeper', daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                ride_id = self._queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                with app.app_context():
+                    try:
+                        self._assign(ride_id)
+                    except Exception as e:
+                        db.session.rollback()
+                        logging.error(f"Dispatching ride {ride_id} failed: {e}")
+            finally:
+                with self._queued_lock:
+                    self._queued.discard(ride_id)
+
+    def _sweep(self):
+        # First pass runs immediately to pick up rides left pending by a restart
+        while True:
+            with app.app_context():
+                try:
+                    ride_ids = [ride_id for (ride_id,) in db.session.query(Ride.id).filter(
+                        Ride.status == 'pending',
+                        Ride.driver_id.is_(None)
+                    ).order_by(Ride.requested_at).limit(self.sweep_limit)]
+                    db.session.rollback()
+                except Exception as e:
+                    db.session.rollback()
+                    logging.error(f"Dispatch sweep failed: {e}")
+                    ride_ids = []
+            for ride_id in ride_ids:
+                self.submit(ride_id)
+            if self._stop.wait(self.retry_seconds):
+                return
+
+
+# Shared by every request in this process; started by routes unless batch dispatch is enabled
+dispatch_queue = DispatchQueue()
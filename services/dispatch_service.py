@@ -0,0 +1,219 @@
+import logging
+import os
+import threading
+import numpy as np
+from sqlalchemy import text
+from app import app, db
+from models import Ride, User
+from services.ai_matching_service import (
+    AIMatchingService,
+    BATCH_CANDIDATES_PER_RIDE,
+    DISTANCE_WEIGHT,
+    EXPERIENCE_WEIGHT,
+    FRESHNESS_WEIGHT,
+    RATING_WEIGHT,
+)
+from services.assignment import solve_assignment
+from services.driver_features import driver_features
+from services.driver_index import driver_index
+from services.pending_rides import pending_rides
+from services.location_service import LocationService
+
+# Arbitrary key for the PostgreSQL advisory lock that keeps one dispatcher round running at a time
+_DISPATCH_LOCK_KEY = 724551
+
+
+class BatchDispatcher:
+    """
+    Periodically matches all pending rides to all available drivers at once.
+
+    Each round builds a cost matrix from pickup distance and the basic
+    matcher's rating, experience and freshness factors. When Gemini is
+    configured, the oldest `model_rides` rides and their cheapest locked
+    drivers go to the model in one batched call; the rides it leaves
+    unanswered (all of them if it fails or misses the matching deadline)
+    are solved as an optimal assignment over the remaining drivers. Rides
+    and drivers are read without row locks, and each match is then
+    committed with the same conditional driver and ride claims as
+    accept_ride; matches whose ride or driver was taken meanwhile are
+    skipped. Pairs farther apart than `max_pickup_km` are never matched.
+    """
+
+    def __init__(self, interval_seconds=None, max_pickup_km=15, max_rides=1000, model_rides=50, matcher=None):
+        if interval_seconds is None:
+            interval_seconds = float(os.environ.get('BATCH_DISPATCH_INTERVAL_SECONDS', 0))
+        self.interval_seconds = interval_seconds
+        self.max_pickup_km = max_pickup_km
+        self.max_rides = max_rides
+        self.model_rides = model_rides
+        self.matcher = matcher
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def enabled(self):
+        return self.interval_seconds > 0
+
+    def build_cost_matrix(self, rides, drivers):
+        """Rides x drivers matrix of assignment costs; infeasible pairs are np.inf"""
+        positions = [LocationService.get_driver_position(driver) for driver in drivers]
+        distances = LocationService.haversine_distance_matrix(
+            [ride.pickup_lat for ride in rides], [ride.pickup_lng for ride in rides],
+            [position[0] for position in positions], [position[1] for position in positions]
+        )
+
+        columns = driver_features.columns(drivers)
+        rating = columns['rating']
+        experience = np.minimum(5, columns['total_rides'] / 20)
+        freshness = AIMatchingService._freshness_scores(columns['location_age_minutes'])
+
+        # Same factors and weights as AIMatchingService.rank_drivers
+        score = (np.maximum(0, 10 - distances) * DISTANCE_WEIGHT
+                 + (rating * RATING_WEIGHT + experience * EXPERIENCE_WEIGHT + freshness * FRESHNESS_WEIGHT)[None, :])
+        # Highest score wins; the small distance term breaks ties past the 10 km score floor
+        cost = -score + distances * 0.01
+        cost[distances > self.max_pickup_km] = np.inf
+        return cost
+
+    def model_pairs(self, rides, drivers, cost):
+        """
+        (ride, driver) index pairs the model picked in one batched call,
+        choosing among each ride's cheapest feasible drivers
+        """
+        if self.matcher is None:
+            self.matcher = AIMatchingService()
+        if not self.matcher.model:
+            return []
+
+        rides = rides[:self.model_rides]
+        candidates = []
+        for r in range(len(rides)):
+            feasible = np.flatnonzero(np.isfinite(cost[r]))
+            best = feasible[np.argsort(cost[r, feasible], kind='stable')[:BATCH_CANDIDATES_PER_RIDE]]
+            candidates.append([drivers[d] for d in best])
+        if not any(candidates):
+            return []
+
+        ride_requests = [{
+            'pickup_lat': ride.pickup_lat, 'pickup_lng': ride.pickup_lng,
+            'dropoff_lat': ride.dropoff_lat, 'dropoff_lng': ride.dropoff_lng,
+            'pickup_address': ride.pickup_address, 'dropoff_address': ride.dropoff_address,
+            'distance_km': ride.distance_km, 'notes': ride.notes
+        } for ride in rides]
+        picks = self.matcher.find_optimal_drivers(ride_requests, candidates=candidates, fill=False)
+
+        column = {driver.id: d for d, driver in enumerate(drivers)}
+        return [(r, column[driver.id]) for r, driver in enumerate(picks) if driver is not None]
+
+    def run_once(self):
+        """Match pending rides to available drivers. Returns [(ride_id, driver_id), ...]."""
+        if db.engine.dialect.name != 'postgresql':
+            return self._run_round()
+
+        # Session-level lock on its own connection, so it outlasts the per-pair commits of the round
+        with db.engine.connect() as connection:
+            if not connection.execute(text('SELECT pg_try_advisory_lock(:key)'), {'key': _DISPATCH_LOCK_KEY}).scalar():
+                return []
+            try:
+                return self._run_round()
+            finally:
+                connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': _DISPATCH_LOCK_KEY})
+
+    def _run_round(self):
+        # Read without row locks: the model call and the solve take seconds, and
+        # accepts, claims and location flushes must not queue behind them
+        rides = Ride.query.filter(
+            Ride.status == 'pending',
+            Ride.driver_id.is_(None),
+            Ride.pickup_lat.isnot(None),
+            Ride.pickup_lng.isnot(None)
+        ).order_by(Ride.requested_at).limit(self.max_rides).all()
+        if not rides:
+            db.session.rollback()
+            return []
+
+        drivers = [
+            driver for driver in User.query.filter_by(role='driver', is_available=True)
+            if LocationService.get_driver_position(driver)[0] is not None
+        ]
+        if not drivers:
+            db.session.rollback()
+            return []
+
+        cost = self.build_cost_matrix(rides, drivers)
+        # The solver needs finite costs; anything above every feasible cost marks a forbidden pair
+        feasible = np.isfinite(cost)
+        if not feasible.any():
+            db.session.rollback()
+            return []
+        forbidden = np.abs(cost[feasible]).max() * 10 + 1e6
+
+        pairs = self.model_pairs(rides, drivers, cost)
+        # Optimal assignment for the rides and drivers the model did not pair
+        open_rides = sorted(set(range(len(rides))) - {r for r, d in pairs})
+        open_drivers = sorted(set(range(len(drivers))) - {d for r, d in pairs})
+        if open_rides and open_drivers:
+            remaining = cost[np.ix_(open_rides, open_drivers)]
+            pairs += [
+                (open_rides[r], open_drivers[d])
+                for r, d in solve_assignment(np.where(np.isfinite(remaining), remaining, forbidden))
+                if np.isfinite(remaining[r, d])
+            ]
+        pairs = [(rides[r].id, drivers[d].id) for r, d in sorted(pairs)]
+        db.session.rollback()
+
+        assignments = [(ride_id, driver_id) for ride_id, driver_id in pairs if self._claim(ride_id, driver_id)]
+        for ride_id, driver_id in assignments:
+            pending_rides.remove(ride_id)
+            driver_index.remove(driver_id)
+            driver_features.set_available(driver_id, False)
+
+        if assignments:
+            logging.info(f"Batch dispatch assigned {len(assignments)} of {len(rides)} pending rides"
+                         f" ({len(pairs) - len(assignments)} matches lost to concurrent claims)")
+        return assignments
+
+    @staticmethod
+    def _claim(ride_id, driver_id):
+        """
+        Commit one match with the same conditional claims as accept_ride;
+        False if the driver or the ride was taken since the round read them
+        """
+        # ride_service imports this module for batch_dispatcher
+        from services.ride_service import RideService
+
+        claimed = User.query.filter(
+            User.id == driver_id,
+            User.is_available.is_(True)
+        ).update({User.is_available: False}, synchronize_session=False)
+        if not claimed:
+            db.session.rollback()
+            return False
+        if not RideService._claim_ride(ride_id, driver_id):
+            db.session.rollback()
+            return False
+        db.session.commit()
+        return True
+
+    def start(self):
+        """Run a dispatch round every interval_seconds on a background thread"""
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='batch-dispatch', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            with app.app_context():
+                try:
+                    self.run_once()
+                except Exception as e:
+                    db.session.rollback()
+                    logging.error(f"Batch dispatch round failed: {e}")
+
+
+# Shared by every request in this process; disabled unless BATCH_DISPATCH_INTERVAL_SECONDS > 0
+batch_dispatcher = BatchDispatcher()
@@ -0,0 +1,168 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+# Distance Matrix API limits per request
+MAX_ORIGINS = 25
+MAX_DESTINATIONS = 25
+MAX_ELEMENTS = 100
+
+# Metres per degree of latitude (and of longitude at the equator)
+_METRES_PER_DEGREE = 111195
+
+
+def quantize_point(point, cell_m):
+    """Grid cell (row, col) of a {'lat', 'lng'} point for cells of roughly cell_m metres"""
+    cell_deg = cell_m / _METRES_PER_DEGREE
+    return (round(point['lat'] / cell_deg), round(point['lng'] / cell_deg))
+
+
+def time_bucket(when=None, bucket_minutes=60):
+    """Index of the time-of-day bucket, so rush-hour durations are cached apart from night-time ones"""
+    when = when or datetime.now()
+    return (when.hour * 60 + when.minute) // bucket_minutes
+
+
+def route_cache_key(origin, destination, cell_m, bucket_minutes, when=None):
+    o_row, o_col = quantize_point(origin, cell_m)
+    d_row, d_col = quantize_point(destination, cell_m)
+    return f"{o_row}:{o_col}:{d_row}:{d_col}:{time_bucket(when, bucket_minutes)}"
+
+
+class _PendingLookup:
+    __slots__ = ('origin', 'destination', 'origin_cell', 'destination_cell', 'event', 'element', 'promoted')
+
+    def __init__(self, origin, destination, cell_m):
+        self.origin = origin
+        self.destination = destination
+        self.origin_cell = quantize_point(origin, cell_m)
+        self.destination_cell = quantize_point(destination, cell_m)
+        self.event = threading.Event()
+        self.element = None
+        self.promoted = False  # woken to lead the next batch rather than with a result
+
+
+class DistanceMatrixCoalescer:
+    """
+    Merges concurrent single origin/destination lookups into batched
+    Distance Matrix requests.
+
+    The first caller to arrive becomes the leader: it waits `window_ms` for
+    other callers to queue up, then sends one request covering its own pair
+    and as many queued pairs as fit the API limits, and hands each caller
+    its element. If lookups are still queued, the oldest one's caller is
+    woken to lead the next request, so no caller sends more than one.
+    Pairs whose endpoints fall in the same grid cells share one element.
+    """
+
+    def __init__(self, fetch, cell_m, window_ms=None, wait_timeout=15, on_element=None):
+        self.fetch = fetch  # fetch(origins, destinations) -> Distance Matrix response or None
+        self.on_element = on_element  # on_element(origin, destination, element) for every OK element
+        self.cell_m = cell_m
+        if window_ms is None:
+            window_ms = float(os.environ.get('DISTANCE_MATRIX_COALESCE_MS', 20))
+        self.window_seconds = window_ms / 1000
+        self.wait_timeout = wait_timeout
+
+        self.requests_sent = 0
+        self.pairs_served = 0
+
+        self._lock = threading.Lock()
+        self._pending = []
+        self._leader_active = False
+
+    def lookup(self, origin, destination):
+        """Distance Matrix element for one pair, or None if the API call failed"""
+        pending = _PendingLookup(origin, destination, self.cell_m)
+        with self._lock:
+            self._pending.append(pending)
+            lead = not self._leader_active
+            if lead:
+                self._leader_active = True
+
+        if lead:
+            time.sleep(self.window_seconds)
+            self._lead(pending)
+            return pending.element
+
+        pending.event.wait(self.wait_timeout)
+        with self._lock:
+            # Promotion happens under the lock, so a timed-out caller either leads or withdraws
+            lead = pending.promoted
+            if not pending.event.is_set() and pending in self._pending:
+                self._pending.remove(pending)
+        if lead:
+            # Lookups queued up while the previous leader's request was in flight; send right away
+            self._lead(pending)
+        return pending.element
+
+    def _lead(self, own):
+        """Send one batch led by `own`, then hand leadership to the oldest queued lookup"""
+        with self._lock:
+            batch = self._take_batch(own)
+        try:
+            self._send(batch)
+        except Exception as e:
+            logging.error(f"Coalesced distance matrix request failed: {e}")
+        finally:
+            for pending in batch:
+                pending.event.set()
+
+        with self._lock:
+            if self._pending:
+                successor = self._pending[0]
+                successor.promoted = True
+                successor.event.set()
+            else:
+                self._leader_active = False
+
+    def _take_batch(self, first):
+        """
+        Pop `first` plus the queued lookups that fit one request's origin,
+        destination and element limits alongside it
+        """
+        origins, destinations = set(), set()
+        batch, remaining = [], []
+        for pending in [first] + [p for p in self._pending if p is not first]:
+            new_origins = origins | {pending.origin_cell}
+            new_destinations = destinations | {pending.destination_cell}
+            if (len(new_origins) <= MAX_ORIGINS and len(new_destinations) <= MAX_DESTINATIONS
+                    and len(new_origins) * len(new_destinations) <= MAX_ELEMENTS):
+                origins, destinations = new_origins, new_destinations
+                batch.append(pending)
+            else:
+                remaining.append(pending)
+        self._pending = remaining
+        return batch
+
+    def _send(self, batch):
+        origin_index, destination_index = {}, {}
+        origins, destinations = [], []
+        for pending in batch:
+            if pending.origin_cell not in origin_index:
+                origin_index[pending.origin_cell] = len(origins)
+                origins.append(pending.origin)
+            if pending.destination_cell not in destination_index:
+                destination_index[pending.destination_cell] = len(destinations)
+                destinations.append(pending.destination)
+
+        data = self.fetch(origins, destinations)
+        self.requests_sent += 1
+        if not data or data.get('status') != 'OK':
+            return
+
+        rows = data['rows']
+        if self.on_element:
+            # The response covers the whole cross product; let the caller cache all of it
+            for i, origin in enumerate(origins):
+                for j, destination in enumerate(destinations):
+                    element = rows[i]['elements'][j]
+                    if element.get('status') == 'OK':
+                        self.on_element(origin, destination, element)
+
+        for pending in batch:
+            element = rows[origin_index[pending.origin_cell]]['elements'][destination_index[pending.destination_cell]]
+            pending.element = element
+            self.pairs_served += 1
@@ -0,0 +1,262 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import func
+from app import db
+from models import DriverStats, Ride, User
+from services.location_buffer import location_buffer
+
+# Recent-activity window and cap used by matching
+RECENT_RIDES_DAYS = 30
+RECENT_RIDES_CAP = 10
+
+# Acceptance rate prior, so a driver with few resolved offers is not scored 0% or 100%
+PRIOR_OFFERS = 10
+PRIOR_ACCEPTANCE_RATE = 0.9
+
+_INITIAL_CAPACITY = 256
+
+
+class DriverFeatureStore:
+    """
+    Process-wide matching features for every driver, one row per driver in
+    column arrays.
+
+    Rating, ride counts, offer outcomes, availability, last location time
+    and parsed vehicle info are kept up to date by the ride, availability
+    and location write paths, so scoring a candidate is an O(1) row read
+    instead of per-request queries and JSON parsing. Like the driver index,
+    the store is rebuilt from the database every `refresh_seconds` to pick
+    up changes made by other workers and to age rides out of the recent
+    window.
+    """
+
+    def __init__(self, refresh_seconds=None):
+        if refresh_seconds is None:
+            refresh_seconds = float(os.environ.get('DRIVER_FEATURES_REFRESH_SECONDS', 300))
+        self.refresh_seconds = refresh_seconds
+
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._allocate(_INITIAL_CAPACITY)
+
+    def _allocate(self, capacity):
+        self._rows = {}  # driver_id -> row
+        self._ids = []
+        self.rating = np.zeros(capacity, dtype=np.float32)
+        self.total_rides = np.zeros(capacity, dtype=np.int32)
+        self.recent_rides = np.zeros(capacity, dtype=np.int32)
+        self.offers = np.zeros(capacity, dtype=np.int32)
+        self.accepts = np.zeros(capacity, dtype=np.int32)
+        self.available = np.zeros(capacity, dtype=bool)
+        self.location_updated_at = np.full(capacity, np.nan)  # epoch seconds
+        self.vehicle_year = np.zeros(capacity, dtype=np.int16)
+        self.vehicle_type = [None] * capacity
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    def ensure_fresh(self):
+        """Load the store from the database if it is empty or older than refresh_seconds"""
+        loaded_at = self._loaded_at
+        if loaded_at is not None and time.monotonic() - loaded_at < self.refresh_seconds:
+            return
+        self.reload()
+
+    def reload(self):
+        """Rebuild every row from the users, rides and driver_stats tables"""
+        drivers = db.session.query(
+            User.id, User.rating, User.total_rides, User.is_available,
+            User.location_updated_at, User.vehicle_info
+        ).filter(User.role == 'driver').all()
+
+        recent = dict(db.session.query(Ride.driver_id, func.count(Ride.id)).filter(
+            Ride.driver_id.isnot(None),
+            Ride.completed_at >= datetime.now() - timedelta(days=RECENT_RIDES_DAYS),
+            Ride.status == 'completed'
+        ).group_by(Ride.driver_id).all())
+
+        stats = {
+            driver_id: (offers, accepts)
+            for driver_id, offers, accepts in db.session.query(
+                DriverStats.driver_id, DriverStats.offers, DriverStats.accepts
+            ).all()
+        }
+
+        with self._lock:
+            self._allocate(max(_INITIAL_CAPACITY, len(drivers) * 2))
+            for driver_id, rating, total_rides, is_available, updated_at, vehicle_info in drivers:
+                row = self._row(driver_id)
+                self._set_profile(row, rating, total_rides, is_available, updated_at, vehicle_info)
+                self.recent_rides[row] = recent.get(driver_id, 0)
+                self.offers[row], self.accepts[row] = stats.get(driver_id, (0, 0))
+            self._loaded_at = time.monotonic()
+
+    # ------------------------------------------------------------------
+    # Write path
+    # ------------------------------------------------------------------
+
+    def sync_driver(self, driver):
+        """Copy a driver's profile columns (rating, rides, availability, vehicle) into its row"""
+        if driver.role == 'driver':
+            with self._lock:
+                self._sync(driver)
+
+    def set_available(self, driver_id, available):
+        with self._lock:
+            row = self._rows.get(driver_id)
+            if row is not None:
+                self.available[row] = available
+
+    def record_location(self, driver_id, recorded_at=None):
+        with self._lock:
+            row = self._rows.get(driver_id)
+            if row is not None:
+                self.location_updated_at[row] = (recorded_at or datetime.now()).timestamp()
+
+    def record_completed(self, driver_id):
+        """A ride by this driver was completed just now"""
+        with self._lock:
+            row = self._rows.get(driver_id)
+            if row is not None:
+                self.recent_rides[row] += 1
+
+    def record_offer(self, driver_id, accepted):
+        """An offered ride resolved: the driver started it (accepted) or cancelled it"""
+        with self._lock:
+            row = self._rows.get(driver_id)
+            if row is not None:
+                self.offers[row] += 1
+                self.accepts[row] += int(accepted)
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def features(self, driver):
+        """Matching features of one driver; drivers not loaded yet are added from the User row"""
+        self.ensure_fresh()
+        with self._lock:
+            row = self._rows.get(driver.id)
+            if row is None:
+                row = self._sync(driver)
+            return self._features(row, time.time())
+
+    def features_many(self, drivers):
+        """features() for several drivers, in the same order"""
+        self.ensure_fresh()
+        now = time.time()
+        with self._lock:
+            results = []
+            for driver in drivers:
+                row = self._rows.get(driver.id)
+                if row is None:
+                    row = self._sync(driver)
+                results.append(self._features(row, now))
+            return results
+
+    def columns(self, drivers):
+        """
+        Scoring columns for several drivers as arrays in the same order:
+        rating, total_rides, available and location_age_minutes (NaN when unknown)
+        """
+        self.ensure_fresh()
+        now = time.time()
+        with self._lock:
+            rows = np.fromiter(
+                (self._rows[d.id] if d.id in self._rows else self._sync(d) for d in drivers),
+                dtype=np.int64, count=len(drivers)
+            )
+            return {
+                'rating': self.rating[rows].astype(np.float64),
+                'total_rides': self.total_rides[rows].astype(np.float64),
+                'available': self.available[rows],
+                'location_age_minutes': np.maximum(0, (now - self.location_updated_at[rows]) / 60)
+            }
+
+    def __contains__(self, driver_id):
+        return driver_id in self._rows
+
+    def __len__(self):
+        return len(self._ids)
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _row(self, driver_id):
+        row = self._rows.get(driver_id)
+        if row is None:
+            row = len(self._ids)
+            if row == len(self.rating):
+                self._grow()
+            self._rows[driver_id] = row
+            self._ids.append(driver_id)
+        return row
+
+    def _grow(self):
+        capacity = len(self.rating) * 2
+        for name in ('rating', 'total_rides', 'recent_rides', 'offers', 'accepts', 'available', 'vehicle_year'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+        location_updated_at = np.full(capacity, np.nan)
+        location_updated_at[:len(self.location_updated_at)] = self.location_updated_at
+        self.location_updated_at = location_updated_at
+        self.vehicle_type.extend([None] * (capacity - len(self.vehicle_type)))
+
+    def _sync(self, driver):
+        row = self._row(driver.id)
+        self._set_profile(
+            row, driver.rating, driver.total_rides, driver.is_available,
+            driver.location_updated_at, driver.vehicle_info
+        )
+        return row
+
+    def _set_profile(self, row, rating, total_rides, is_available, updated_at, vehicle_info):
+        self.rating[row] = rating or 0
+        self.total_rides[row] = total_rides or 0
+        self.available[row] = bool(is_available)
+
+        # An unflushed buffered fix is newer than the row's timestamp
+        buffered = location_buffer.latest(self._ids[row])
+        if buffered is not None:
+            updated_at = buffered[2]
+        self.location_updated_at[row] = updated_at.timestamp() if updated_at else np.nan
+
+        try:
+            vehicle = json.loads(vehicle_info) if vehicle_info else {}
+        except ValueError:
+            vehicle = {}
+        self.vehicle_type[row] = vehicle.get('type', 'sedan')
+        try:
+            self.vehicle_year[row] = int(vehicle.get('year') or 2020)
+        except (TypeError, ValueError):
+            self.vehicle_year[row] = 2020
+
+    def _features(self, row, now):
+        offers = int(self.offers[row])
+        accepts = int(self.accepts[row])
+        updated_at = self.location_updated_at[row]
+        return {
+            'rating': float(self.rating[row]),
+            'total_rides': int(self.total_rides[row]),
+            'recent_rides_count': min(int(self.recent_rides[row]), RECENT_RIDES_CAP),
+            'offers': offers,
+            'acceptance_rate': round(
+                (accepts + PRIOR_ACCEPTANCE_RATE * PRIOR_OFFERS) / (offers + PRIOR_OFFERS), 2
+            ),
+            'is_available': bool(self.available[row]),
+            'location_age_minutes': None if np.isnan(updated_at) else max(0, int((now - updated_at) / 60)),
+            'vehicle_type': self.vehicle_type[row],
+            'vehicle_year': int(self.vehicle_year[row])
+        }
+
+
+# Shared by every request in this process
+driver_features = DriverFeatureStore()
@@ -0,0 +1,218 @@
+import math
+import os
+import threading
+import time
+from app import db
+from models import User
+from services.location_buffer import location_buffer
+from services.geo import EARTH_RADIUS_KM, bounding_box, haversine_km, haversine_km_batch
+
+# Tiny pad so points sitting exactly on a box edge are never dropped by float rounding
+_EDGE_PAD_DEG = 1e-9
+
+# Below this many candidates the scalar formula beats NumPy's per-call overhead
+_BATCH_DISTANCE_MIN = 64
+
+
+class DriverLocationIndex:
+    """
+    Process-wide grid index of available drivers.
+
+    Drivers are bucketed into fixed-size lat/lng cells so radius and
+    k-nearest queries only look at the cells that can contain matches
+    instead of scanning every driver row. The index is kept in sync by the
+    location and availability write paths, and is rebuilt from the database
+    every `refresh_seconds` to pick up changes made by other workers.
+    """
+
+    def __init__(self, cell_size_deg=None, refresh_seconds=None):
+        self.cell_size_deg = cell_size_deg or float(os.environ.get('DRIVER_INDEX_CELL_DEG', 0.01))
+        if refresh_seconds is None:
+            refresh_seconds = float(os.environ.get('DRIVER_INDEX_REFRESH_SECONDS', 30))
+        self.refresh_seconds = refresh_seconds
+
+        self._lock = threading.RLock()
+        self._drivers = {}  # driver_id -> snapshot dict
+        self._cells = {}  # (row, col) -> set of driver_ids
+        self._loaded_at = None
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    def ensure_fresh(self):
+        """Load the index from the database if it is empty or older than refresh_seconds"""
+        loaded_at = self._loaded_at
+        if loaded_at is not None and time.monotonic() - loaded_at < self.refresh_seconds:
+            return
+        self.reload()
+
+    def reload(self):
+        """Rebuild the index from all available drivers with location data"""
+        has_location = db.and_(User.current_lat.isnot(None), User.current_lng.isnot(None))
+        buffered_ids = location_buffer.driver_ids()
+        if buffered_ids:
+            # Drivers whose first fix has not been flushed yet still belong in the index
+            has_location = db.or_(has_location, User.id.in_(buffered_ids))
+        drivers = User.query.filter_by(
+            role='driver',
+            is_available=True
+        ).filter(has_location).all()
+
+        with self._lock:
+            self._drivers = {}
+            self._cells = {}
+            for driver in drivers:
+                entry = self._snapshot(driver)
+                if entry['lat'] is not None and entry['lng'] is not None:
+                    self._insert(entry)
+            self._loaded_at = time.monotonic()
+
+    def clear(self):
+        """Drop all entries; the next query reloads from the database"""
+        with self._lock:
+            self._drivers = {}
+            self._cells = {}
+            self._loaded_at = None
+
+    # ------------------------------------------------------------------
+    # Write path
+    # ------------------------------------------------------------------
+
+    def sync_driver(self, driver):
+        """Add, move or remove a driver so the index matches its current state"""
+        with self._lock:
+            self._remove(driver.id)
+            if driver.role == 'driver' and driver.is_available:
+                entry = self._snapshot(driver)
+                if entry['lat'] is not None and entry['lng'] is not None:
+                    self._insert(entry)
+
+    def update_location(self, driver_id, lat, lng):
+        """Move an indexed driver. Returns False if the driver is not indexed."""
+        with self._lock:
+            entry = self._drivers.get(driver_id)
+            if entry is None:
+                return False
+            self._remove(driver_id)
+            entry['lat'] = lat
+            entry['lng'] = lng
+            self._insert(entry)
+            return True
+
+    def remove(self, driver_id):
+        """Remove a driver, e.g. when they go offline or get assigned a ride"""
+        with self._lock:
+            self._remove(driver_id)
+
+    def __contains__(self, driver_id):
+        return driver_id in self._drivers
+
+    def __len__(self):
+        return len(self._drivers)
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def within_radius(self, lat, lng, radius_km):
+        """Return (distance_km, snapshot) pairs for drivers within radius_km, nearest first"""
+        self.ensure_fresh()
+        with self._lock:
+            candidates = self._candidates(lat, lng, radius_km)
+            if len(candidates) >= _BATCH_DISTANCE_MIN:
+                distances = haversine_km_batch(
+                    lat, lng,
+                    [entry['lat'] for entry in candidates],
+                    [entry['lng'] for entry in candidates]
+                ).tolist()
+            else:
+                distances = [haversine_km(lat, lng, entry['lat'], entry['lng']) for entry in candidates]
+            results = [
+                (distance, dict(entry))
+                for distance, entry in zip(distances, candidates)
+                if distance <= radius_km
+            ]
+        results.sort(key=lambda x: x[0])
+        return results
+
+    def nearest(self, lat, lng, k, max_radius_km=None):
+        """Return up to k (distance_km, snapshot) pairs nearest to the point"""
+        if k <= 0:
+            return []
+        limit = max_radius_km if max_radius_km is not None else math.pi * EARTH_RADIUS_KM
+        radius = min(limit, 1.0)
+        while True:
+            results = self.within_radius(lat, lng, radius)
+            # Every driver within `radius` is in results, so once we have k the
+            # first k are the exact k nearest
+            if len(results) >= k or radius >= limit:
+                return results[:k]
+            radius = min(limit, radius * 4)
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_size_deg), math.floor(lng / self.cell_size_deg))
+
+    def _candidates(self, lat, lng, radius_km):
+        box = bounding_box(lat, lng, radius_km)
+        if box is None:
+            return list(self._drivers.values())
+
+        min_lat, max_lat, min_lng, max_lng = box
+        min_row, min_col = self._cell(min_lat - _EDGE_PAD_DEG, min_lng - _EDGE_PAD_DEG)
+        max_row, max_col = self._cell(max_lat + _EDGE_PAD_DEG, max_lng + _EDGE_PAD_DEG)
+
+        candidates = []
+        box_cells = (max_row - min_row + 1) * (max_col - min_col + 1)
+        if box_cells <= len(self._cells):
+            for row in range(min_row, max_row + 1):
+                for col in range(min_col, max_col + 1):
+                    for driver_id in self._cells.get((row, col), ()):
+                        candidates.append(self._drivers[driver_id])
+        else:
+            # Box covers more cells than are occupied; walk the occupied ones instead
+            for (row, col), driver_ids in self._cells.items():
+                if min_row <= row <= max_row and min_col <= col <= max_col:
+                    candidates.extend(self._drivers[driver_id] for driver_id in driver_ids)
+        return candidates
+
+    def _insert(self, entry):
+        cell = self._cell(entry['lat'], entry['lng'])
+        entry['_cell'] = cell
+        self._drivers[entry['driver_id']] = entry
+        self._cells.setdefault(cell, set()).add(entry['driver_id'])
+
+    def _remove(self, driver_id):
+        entry = self._drivers.pop(driver_id, None)
+        if entry is None:
+            return
+        members = self._cells.get(entry['_cell'])
+        if members is not None:
+            members.discard(driver_id)
+            if not members:
+                del self._cells[entry['_cell']]
+
+    @staticmethod
+    def _snapshot(driver):
+        # Buffered fixes are newer than the row until the next flush
+        lat, lng = driver.current_lat, driver.current_lng
+        buffered = location_buffer.latest(driver.id)
+        if buffered is not None:
+            lat, lng = buffered[0], buffered[1]
+        return {
+            'driver_id': driver.id,
+            'name': f"{driver.first_name or ''} {driver.last_name or ''}".strip(),
+            'lat': lat,
+            'lng': lng,
+            'rating': driver.rating,
+            'total_rides': driver.total_rides,
+            'vehicle_info': driver.vehicle_info
+        }
+
+
+# Shared by every request in this process
+driver_index = DriverLocationIndex()
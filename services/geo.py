@@ -0,0 +1,72 @@
+import math
+import numpy as np
+
+EARTH_RADIUS_KM = 6371  # Earth's radius in km
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Calculate distance between two points using Haversine formula"""
+    lat1_rad = math.radians(lat1)
+    lng1_rad = math.radians(lng1)
+    lat2_rad = math.radians(lat2)
+    lng2_rad = math.radians(lng2)
+
+    dlat = lat2_rad - lat1_rad
+    dlng = lng2_rad - lng1_rad
+
+    a = (math.sin(dlat/2)**2 +
+         math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlng/2)**2)
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+
+    return EARTH_RADIUS_KM * c
+
+
+def bounding_box(lat, lng, radius_km):
+    """
+    Smallest lat/lng box containing every point within radius_km of (lat, lng).
+    Returns (min_lat, max_lat, min_lng, max_lng), or None when the circle
+    touches a pole or wraps the antimeridian and no simple box exists.
+    """
+    angular = radius_km / EARTH_RADIUS_KM
+    dlat = math.degrees(angular)
+    min_lat, max_lat = lat - dlat, lat + dlat
+    if min_lat <= -90 or max_lat >= 90:
+        return None
+
+    ratio = math.sin(angular) / math.cos(math.radians(lat))
+    if angular >= math.pi / 2 or ratio >= 1:
+        return None
+    dlng = math.degrees(math.asin(ratio))
+    min_lng, max_lng = lng - dlng, lng + dlng
+    if min_lng < -180 or max_lng > 180:
+        return None
+
+    return min_lat, max_lat, min_lng, max_lng
+
+
+def haversine_km_batch(lat, lng, lats, lngs):
+    """
+    Distances in km from one origin to N points in a single vectorized pass.
+    `lats` and `lngs` are array-likes of equal length; returns a float64 array.
+    """
+    lat1 = np.radians(lat)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    dlat = lat2 - lat1
+    dlng = np.radians(np.asarray(lngs, dtype=np.float64)) - np.radians(lng)
+
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def haversine_km_matrix(lats1, lngs1, lats2, lngs2):
+    """
+    N x M matrix of distances in km between two sets of points, e.g. pending
+    pickups (rows) and available drivers (columns).
+    """
+    lat1 = np.radians(np.asarray(lats1, dtype=np.float64))[:, None]
+    lng1 = np.radians(np.asarray(lngs1, dtype=np.float64))[:, None]
+    lat2 = np.radians(np.asarray(lats2, dtype=np.float64))[None, :]
+    lng2 = np.radians(np.asarray(lngs2, dtype=np.float64))[None, :]
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+# (connect, read) timeouts in seconds per Google Maps endpoint
+DEFAULT_TIMEOUTS = {
+    'geocode': (3.05, 5),
+    'distance_matrix': (3.05, 8),
+    'autocomplete': (2, 3),
+    'place_details': (3.05, 5),
+}
+
+# Google reports these in the JSON body with HTTP 200; they are worth retrying
+RETRYABLE_API_STATUSES = {'OVER_QUERY_LIMIT', 'UNKNOWN_ERROR'}
+RETRYABLE_HTTP_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose circuit breaker is open"""
+
+
+class _RetryableError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open breaker.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    calls fail immediately for `reset_timeout` seconds. Then a single trial
+    call is let through; success closes the circuit, failure re-opens it,
+    and a trial abandoned without an outcome (e.g. a cancelled coroutine)
+    lets the next call try instead.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        with self._lock:
+            self._trial_in_flight = False
+
+
+class PooledHTTPClient:
+    """
+    Shared keep-alive HTTP client for outbound API calls.
+
+    One requests.Session with a bounded connection pool is reused by every
+    thread in the process, so repeated calls skip the TCP and TLS
+    handshakes. Each named endpoint gets its own timeouts and circuit
+    breaker; transient failures are retried with full-jitter exponential
+    backoff.
+    """
+
+    def __init__(self, timeouts=None, pool_maxsize=None, max_retries=None,
+                 backoff_base=0.1, backoff_cap=2.0, failure_threshold=5, reset_timeout=30):
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.max_retries = max_retries if max_retries is not None else int(os.environ.get('HTTP_MAX_RETRIES', 2))
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        pool_maxsize = pool_maxsize or int(os.environ.get('HTTP_POOL_MAXSIZE', 20))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+
+    def breaker(self, endpoint):
+        with self._breakers_lock:
+            breaker = self._breakers.get(endpoint)
+            if breaker is None:
+                breaker = self._breakers[endpoint] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return breaker
+
+    def attempt_timeout(self, endpoint, deadline=None):
+        """(connect, read) timeouts for the next attempt, cut short to end by `deadline`"""
+        connect_timeout, read_timeout = self.timeouts.get(endpoint, (3.05, 10))
+        if deadline is None:
+            return connect_timeout, read_timeout
+        remaining = max(0.001, deadline - time.monotonic())
+        return min(connect_timeout, remaining), min(read_timeout, remaining)
+
+    def retry_delay(self, attempt, deadline=None):
+        """Backoff before retry number attempt + 1, or None when no retry is left before `deadline`"""
+        if attempt >= self.max_retries:
+            return None
+        delay = self.backoff_delay(attempt)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    def get_json(self, endpoint, url, params=None, deadline=None):
+        """
+        GET url and return the decoded JSON body. Raises CircuitOpenError
+        when the endpoint is failing, or the last error once retries run
+        out. With a `deadline` (a time.monotonic() value), attempts are cut
+        short and no retry starts that could not finish before it.
+        """
+        breaker = self.breaker(endpoint)
+        if not breaker.allow():
+            raise CircuitOpenError(f"{endpoint} circuit is open")
+
+        try:
+            attempt = 0
+            while True:
+                try:
+                    data = self._get_once(url, params, self.attempt_timeout(endpoint, deadline))
+                except (requests.ConnectionError, requests.Timeout, _RetryableError) as e:
+                    delay = self.retry_delay(attempt, deadline)
+                    if delay is None:
+                        breaker.record_failure()
+                        raise
+                    time.sleep(delay)
+                    attempt += 1
+                    logging.debug(f"Retrying {endpoint} after {e} (attempt {attempt})")
+                    continue
+                except Exception:
+                    breaker.record_failure()
+                    raise
+
+                breaker.record_success()
+                return data
+        except BaseException:
+            # Interrupted without an outcome; don't leave a half-open trial claimed forever
+            breaker.release_trial()
+            raise
+
+    def _get_once(self, url, params, timeout):
+        response = self.session.get(url, params=params, timeout=timeout)
+        if response.status_code in RETRYABLE_HTTP_STATUSES:
+            raise _RetryableError(f"HTTP {response.status_code}")
+        response.raise_for_status()
+        data = response.json()
+        if isinstance(data, dict) and data.get('status') in RETRYABLE_API_STATUSES:
+            raise _RetryableError(data['status'])
+        return data
+
+    def backoff_delay(self, attempt):
+        # Full jitter keeps many workers from retrying in lockstep
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+
+class AsyncPooledHTTPClient:
+    """
+    asyncio counterpart of PooledHTTPClient built on httpx.AsyncClient.
+
+    Shares timeouts, retry policy and circuit breakers with a sync client,
+    so an endpoint tripped by sync callers also fails fast for async ones.
+    The underlying AsyncClient is created on first use and is bound to the
+    event loop that first used it.
+    """
+
+    def __init__(self, sync_client, pool_maxsize=None):
+        self.sync_client = sync_client
+        self.pool_maxsize = pool_maxsize or int(os.environ.get('HTTP_POOL_MAXSIZE', 20))
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(limits=httpx.Limits(
+                max_connections=self.pool_maxsize,
+                max_keepalive_connections=self.pool_maxsize
+            ))
+        return self._client
+
+    async def get_json(self, endpoint, url, params=None, deadline=None):
+        """Async get_json with the same retry, deadline and breaker semantics as the sync client"""
+        sync_client = self.sync_client
+        breaker = sync_client.breaker(endpoint)
+        if not breaker.allow():
+            raise CircuitOpenError(f"{endpoint} circuit is open")
+
+        try:
+            attempt = 0
+            while True:
+                connect_timeout, read_timeout = sync_client.attempt_timeout(endpoint, deadline)
+                try:
+                    data = await self._get_once(url, params, httpx.Timeout(read_timeout, connect=connect_timeout))
+                except (httpx.TransportError, _RetryableError) as e:
+                    delay = sync_client.retry_delay(attempt, deadline)
+                    if delay is None:
+                        breaker.record_failure()
+                        raise
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    logging.debug(f"Retrying {endpoint} after {e} (attempt {attempt})")
+                    continue
+                except Exception:
+                    breaker.record_failure()
+                    raise
+
+                breaker.record_success()
+                return data
+        except BaseException:
+            # CancelledError (e.g. from asyncio.wait_for) skips the arms above
+            breaker.release_trial()
+            raise
+
+    async def _get_once(self, url, params, timeout):
+        response = await self._get_client().get(url, params=params, timeout=timeout)
+        if response.status_code in RETRYABLE_HTTP_STATUSES:
+            raise _RetryableError(f"HTTP {response.status_code}")
+        response.raise_for_status()
+        data = response.json()
+        if isinstance(data, dict) and data.get('status') in RETRYABLE_API_STATUSES:
+            raise _RetryableError(data['status'])
+        return data
+
+
+# Shared by every Google Maps call in this process
+google_maps_client = PooledHTTPClient()
@@ -0,0 +1,127 @@
+import atexit
+import logging
+import os
+import threading
+from datetime import datetime
+from sqlalchemy import update
+from app import app, db
+from models import User
+
+
+class LocationUpdateBuffer:
+    """
+    Write-behind buffer for driver GPS fixes.
+
+    Only the newest fix per driver is kept in memory. A background thread
+    writes all pending fixes to the users table in one bulk UPDATE every
+    `flush_interval` seconds, or sooner once `max_pending` drivers are
+    waiting. Readers that need the live position should go through
+    `latest()` rather than the database row.
+    """
+
+    def __init__(self, flush_interval=None, max_pending=None):
+        if flush_interval is None:
+            flush_interval = float(os.environ.get('LOCATION_FLUSH_INTERVAL_SECONDS', 5))
+        if max_pending is None:
+            max_pending = int(os.environ.get('LOCATION_FLUSH_MAX_PENDING', 500))
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._lock = threading.Lock()
+        self._pending = {}  # driver_id -> (lat, lng, recorded_at)
+        self._inflight = {}  # fixes being written by the current flush
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, driver_id, lat, lng, recorded_at=None):
+        """Record a fix, replacing any older unflushed fix for the same driver"""
+        recorded_at = recorded_at or datetime.now()
+        with self._lock:
+            current = self._pending.get(driver_id)
+            if current is None or current[2] <= recorded_at:
+                self._pending[driver_id] = (lat, lng, recorded_at)
+            pending_count = len(self._pending)
+
+        self._ensure_started()
+        if pending_count >= self.max_pending:
+            self._wake.set()
+
+    def latest(self, driver_id):
+        """Newest unflushed (lat, lng, recorded_at) for a driver, or None"""
+        return self._pending.get(driver_id) or self._inflight.get(driver_id)
+
+    def driver_ids(self):
+        """Ids of drivers with an unflushed fix"""
+        with self._lock:
+            return list(self._pending.keys() | self._inflight.keys())
+
+    def __len__(self):
+        return len(self._pending)
+
+    def flush(self):
+        """Write all pending fixes in one bulk UPDATE. Returns the number of drivers written."""
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            self._inflight = batch
+        if not batch:
+            return 0
+
+        rows = [
+            {
+                'id': driver_id,
+                'current_lat': lat,
+                'current_lng': lng,
+                'location_updated_at': recorded_at
+            }
+            for driver_id, (lat, lng, recorded_at) in batch.items()
+        ]
+
+        with app.app_context():
+            try:
+                db.session.execute(update(User), rows)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Location flush failed for {len(rows)} drivers: {e}")
+                self._requeue(batch)
+                return 0
+            finally:
+                self._inflight = {}
+
+        return len(rows)
+
+    def _requeue(self, batch):
+        """Put failed fixes back unless a newer fix arrived in the meantime"""
+        with self._lock:
+            for driver_id, fix in batch.items():
+                current = self._pending.get(driver_id)
+                if current is None or current[2] < fix[2]:
+                    self._pending[driver_id] = fix
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='location-flush', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Location flush loop error: {e}")
+
+
+# Shared by every request in this process
+location_buffer = LocationUpdateBuffer()
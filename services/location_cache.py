@@ -0,0 +1,211 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Returned by get() when a key is absent or expired; a cached None is a valid negative hit
+MISS = object()
+
+DEFAULT_CACHE_PATH = os.path.join('instance', 'location_cache.sqlite3')
+
+# Eviction scans the namespace, so only run it every this many writes
+_EVICT_EVERY_WRITES = 100
+
+# last_access is only rewritten when older than this, so hot keys don't write on every read
+_TOUCH_INTERVAL_SECONDS = 60
+
+
+class SQLiteTTLCache:
+    """
+    On-disk JSON cache with per-entry TTL and least-recently-used eviction.
+
+    Backed by a local SQLite file so entries survive restarts and are shared
+    by every gunicorn worker on the host. Several caches can share one file
+    by using different namespaces. Storage errors are logged and treated as
+    misses so a broken cache never breaks the caller.
+    """
+
+    def __init__(self, namespace, max_entries=10000, path=None):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.path = path or os.environ.get('LOCATION_CACHE_PATH', DEFAULT_CACHE_PATH)
+
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+        self._local = threading.local()
+        self._schema_ready = False
+        self._writes = 0
+
+    def get(self, key):
+        """Cached value for key, or MISS"""
+        entry = self.get_entry(key)
+        return entry if entry is MISS else entry[0]
+
+    def get_entry(self, key):
+        """Cached (value, expires_at) for key, or MISS"""
+        now = time.time()
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                'SELECT value, expires_at, last_access FROM cache_entries '
+                'WHERE namespace = ? AND key = ?',
+                (self.namespace, key)
+            ).fetchone()
+            if row is None or row[1] <= now:
+                self.misses += 1
+                return MISS
+            if now - row[2] > _TOUCH_INTERVAL_SECONDS:
+                conn.execute(
+                    'UPDATE cache_entries SET last_access = ? WHERE namespace = ? AND key = ?',
+                    (now, self.namespace, key)
+                )
+                conn.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"{self.namespace} cache read failed: {e}")
+            self.misses += 1
+            return MISS
+
+        value = json.loads(row[0])
+        if value is None:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+        return value, row[1]
+
+    def set(self, key, value, ttl_seconds):
+        """Store a JSON-serializable value (None caches a negative result)"""
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute(
+                'INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at, last_access) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (self.namespace, key, json.dumps(value), now + ttl_seconds, now)
+            )
+            self._writes += 1
+            if self._writes % _EVICT_EVERY_WRITES == 0:
+                self._evict(conn, now)
+            conn.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"{self.namespace} cache write failed: {e}")
+
+    def delete(self, key):
+        try:
+            conn = self._connection()
+            conn.execute(
+                'DELETE FROM cache_entries WHERE namespace = ? AND key = ?',
+                (self.namespace, key)
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"{self.namespace} cache delete failed: {e}")
+
+    def stats(self):
+        """Hit/miss counters for this process"""
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.hits + self.negative_hits) / lookups, 3) if lookups else 0.0
+        }
+
+    def _evict(self, conn, now):
+        conn.execute(
+            'DELETE FROM cache_entries WHERE namespace = ? AND expires_at <= ?',
+            (self.namespace, now)
+        )
+        count = conn.execute(
+            'SELECT COUNT(*) FROM cache_entries WHERE namespace = ?', (self.namespace,)
+        ).fetchone()[0]
+        if count > self.max_entries:
+            # Trim a little below the cap so eviction doesn't run on every insert
+            excess = count - int(self.max_entries * 0.9)
+            conn.execute(
+                'DELETE FROM cache_entries WHERE rowid IN ('
+                'SELECT rowid FROM cache_entries WHERE namespace = ? '
+                'ORDER BY last_access LIMIT ?)',
+                (self.namespace, excess)
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        if not self._schema_ready:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache_entries ('
+                'namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+                'expires_at REAL NOT NULL, last_access REAL NOT NULL, '
+                'PRIMARY KEY (namespace, key))'
+            )
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS ix_cache_entries_lru '
+                'ON cache_entries (namespace, last_access)'
+            )
+            conn.commit()
+            self._schema_ready = True
+        return conn
+
+
+class TieredCache:
+    """
+    Bounded in-memory LRU in front of a SQLiteTTLCache.
+
+    Writes go to both tiers, so entries pushed out of memory are still
+    served from disk and promoted back on their next read.
+    """
+
+    def __init__(self, namespace, memory_entries=2000, disk_entries=200000, path=None):
+        self.memory_entries = memory_entries
+        self.disk = SQLiteTTLCache(namespace, max_entries=disk_entries, path=path)
+        self.memory_hits = 0
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (value, expires_at)
+
+    def get(self, key):
+        """Cached value for key, or MISS"""
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                if item[1] > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return item[0]
+                del self._memory[key]
+
+        entry = self.disk.get_entry(key)
+        if entry is MISS:
+            return MISS
+        self._remember(key, *entry)
+        return entry[0]
+
+    def set(self, key, value, ttl_seconds):
+        self._remember(key, value, time.time() + ttl_seconds)
+        self.disk.set(key, value, ttl_seconds)
+
+    def stats(self):
+        stats = self.disk.stats()
+        stats['memory_hits'] = self.memory_hits
+        stats['memory_entries'] = len(self._memory)
+        return stats
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self._memory[key] = (value, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
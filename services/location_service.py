@@ -1,9 +1,53 @@
-import requests
 import os
-from datetime import datetime
+import re
+from sqlalchemy import func, union_all
 from app import db
-from models import User
-import math
+from replica import replica_reads
+from models import Ride, User
+from services.autocomplete_cache import AutocompleteCache
+from services.distance_matrix import DistanceMatrixCoalescer, route_cache_key
+from services.driver_features import driver_features
+from services.driver_index import driver_index
+from services.geo import haversine_km, haversine_km_batch, haversine_km_matrix
+from services.http_client import google_maps_client
+from services.location_buffer import location_buffer
+from services.location_cache import MISS, SQLiteTTLCache, TieredCache
+
+GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+DISTANCE_MATRIX_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
+AUTOCOMPLETE_URL = "https://maps.googleapis.com/maps/api/place/autocomplete/json"
+PLACE_DETAILS_URL = "https://maps.googleapis.com/maps/api/place/details/json"
+
+GEOCODE_CACHE_TTL_SECONDS = int(os.environ.get('GEOCODE_CACHE_TTL_SECONDS', 30 * 24 * 3600))
+GEOCODE_NEGATIVE_TTL_SECONDS = int(os.environ.get('GEOCODE_NEGATIVE_TTL_SECONDS', 600))
+
+geocode_cache = SQLiteTTLCache(
+    'geocode',
+    max_entries=int(os.environ.get('GEOCODE_CACHE_MAX_ENTRIES', 50000))
+)
+
+autocomplete_cache = AutocompleteCache()
+
+# Place geometry almost never changes, so details are kept for a long time
+PLACE_CACHE_TTL_SECONDS = int(os.environ.get('PLACE_CACHE_TTL_SECONDS', 90 * 24 * 3600))
+
+place_details_cache = TieredCache(
+    'place_details',
+    memory_entries=int(os.environ.get('PLACE_CACHE_MEMORY_ENTRIES', 2000)),
+    disk_entries=int(os.environ.get('PLACE_CACHE_DISK_ENTRIES', 200000))
+)
+
+# Routes are cached per ~100 m origin/destination cell and time-of-day bucket
+ROUTE_CACHE_CELL_M = float(os.environ.get('ROUTE_CACHE_CELL_M', 100))
+ROUTE_CACHE_BUCKET_MINUTES = int(os.environ.get('ROUTE_CACHE_BUCKET_MINUTES', 60))
+ROUTE_CACHE_TTL_SECONDS = int(os.environ.get('ROUTE_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+
+route_cache = TieredCache(
+    'distance_matrix',
+    memory_entries=int(os.environ.get('ROUTE_CACHE_MEMORY_ENTRIES', 10000)),
+    disk_entries=int(os.environ.get('ROUTE_CACHE_DISK_ENTRIES', 500000))
+)
+
 
 class LocationService:
     @staticmethod
@@ -13,36 +57,67 @@ class LocationService:
     
     @staticmethod
     def geocode_address(address):
-        """Geocode an address using Google Maps API"""
+        """Geocode an address using Google Maps API, served from geocode_cache when possible"""
         api_key = LocationService.get_google_maps_api_key()
         if not api_key:
             return None
-            
-        url = "https://maps.googleapis.com/maps/api/geocode/json"
+        
+        cache_key = LocationService.normalize_address(address)
+        cached = geocode_cache.get(cache_key)
+        if cached is not MISS:
+            return cached
+        
+        url = GEOCODE_URL
         params = {
             'address': address,
             'key': api_key
         }
         
         try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data['status'] == 'OK' and data['results']:
-                result = data['results'][0]
-                location = result['geometry']['location']
-                return {
-                    'lat': location['lat'],
-                    'lng': location['lng'],
-                    'formatted_address': result['formatted_address'],
-                    'place_id': result.get('place_id')
-                }
+            data = google_maps_client.get_json('geocode', url, params)
+            return LocationService._geocode_result(data, cache_key)
         except Exception as e:
             print(f"Geocoding error: {e}")
             
         return None
     
+    @staticmethod
+    def _geocode_result(data, cache_key):
+        """Extract and cache the first result of a Geocoding API response"""
+        if data['status'] == 'OK' and data['results']:
+            result = data['results'][0]
+            location = result['geometry']['location']
+            geocoded = {
+                'lat': location['lat'],
+                'lng': location['lng'],
+                'formatted_address': result['formatted_address'],
+                'place_id': result.get('place_id')
+            }
+            geocode_cache.set(cache_key, geocoded, GEOCODE_CACHE_TTL_SECONDS)
+            return geocoded
+        elif data['status'] == 'ZERO_RESULTS':
+            # Definitive "not found": remember it briefly so retries don't hit the API
+            geocode_cache.set(cache_key, None, GEOCODE_NEGATIVE_TTL_SECONDS)
+        return None
+    
+    @staticmethod
+    def normalize_address(address):
+        """Canonical cache key for a free-text address"""
+        address = address.strip().lower()
+        address = re.sub(r'\s*,\s*', ', ', address)
+        address = re.sub(r'\s+', ' ', address)
+        return address.strip(' ,.')
+    
+    @staticmethod
+    def get_cache_stats():
+        """Hit/miss counters for the location caches in this process"""
+        return {
+            'geocode': geocode_cache.stats(),
+            'autocomplete': autocomplete_cache.stats(),
+            'place_details': place_details_cache.stats(),
+            'routes': route_cache.stats()
+        }
+    
     @staticmethod
     def calculate_distance_matrix(origins, destinations):
         """Calculate distance and duration between origins and destinations"""
@@ -50,24 +125,12 @@ class LocationService:
         if not api_key:
             return None
             
-        url = "https://maps.googleapis.com/maps/api/distancematrix/json"
+        url = DISTANCE_MATRIX_URL
         
-        # Format origins and destinations
-        origins_str = "|".join([f"{o['lat']},{o['lng']}" for o in origins])
-        destinations_str = "|".join([f"{d['lat']},{d['lng']}" for d in destinations])
-        
-        params = {
-            'origins': origins_str,
-            'destinations': destinations_str,
-            'units': 'metric',
-            'mode': 'driving',
-            'key': api_key
-        }
+        params = LocationService._distance_matrix_params(origins, destinations, api_key)
         
         try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = google_maps_client.get_json('distance_matrix', url, params)
             
             if data['status'] == 'OK':
                 return data
@@ -77,70 +140,129 @@ class LocationService:
         return None
     
     @staticmethod
-    def update_driver_location(driver_id, lat, lng):
-        """Update driver's current location"""
-        driver = User.query.get(driver_id)
-        if driver and driver.role == 'driver':
-            driver.current_lat = lat
-            driver.current_lng = lng
-            driver.location_updated_at = datetime.now()
-            db.session.commit()
-            return True
-        return False
+    def _distance_matrix_params(origins, destinations, api_key):
+        """Distance Matrix query parameters; waypoints are {'lat', 'lng'} dicts or address strings"""
+        def waypoint(w):
+            return w if isinstance(w, str) else f"{w['lat']},{w['lng']}"
+        
+        return {
+            'origins': "|".join(waypoint(o) for o in origins),
+            'destinations': "|".join(waypoint(d) for d in destinations),
+            'units': 'metric',
+            'mode': 'driving',
+            'key': api_key
+        }
     
     @staticmethod
-    def find_nearby_drivers(lat, lng, radius_km=10):
-        """Find available drivers within specified radius"""
-        # Get all available drivers with location data
-        drivers = User.query.filter_by(
-            role='driver',
-            is_available=True
-        ).filter(
-            User.current_lat.isnot(None),
-            User.current_lng.isnot(None)
-        ).all()
+    def get_route_metrics(origin, destination):
+        """
+        Driving distance and duration for one origin/destination pair, as
+        {'distance_km', 'duration_minutes'}. Served from route_cache when a
+        nearby pair was seen in the same time-of-day bucket; otherwise
+        concurrent lookups are merged into one Distance Matrix request.
+        Returns None when the API is unavailable, so callers can fall back
+        to haversine estimates.
+        """
+        if not LocationService.get_google_maps_api_key():
+            return None
         
-        nearby_drivers = []
+        key = route_cache_key(origin, destination, ROUTE_CACHE_CELL_M, ROUTE_CACHE_BUCKET_MINUTES)
+        cached = route_cache.get(key)
+        if cached is not MISS:
+            return cached
         
-        for driver in drivers:
-            distance = LocationService._calculate_haversine_distance(
-                lat, lng, driver.current_lat, driver.current_lng
-            )
-            
-            if distance <= radius_km:
-                nearby_drivers.append({
-                    'driver_id': driver.id,
-                    'name': f"{driver.first_name or ''} {driver.last_name or ''}".strip(),
-                    'lat': driver.current_lat,
-                    'lng': driver.current_lng,
-                    'distance_km': round(distance, 2),
-                    'rating': driver.rating,
-                    'total_rides': driver.total_rides,
-                    'vehicle_info': driver.vehicle_info
-                })
+        element = route_coalescer.lookup(origin, destination)
+        if element and element.get('status') == 'OK':
+            return LocationService._route_metrics(element)
+        return None
+    
+    @staticmethod
+    def _route_metrics(element):
+        return {
+            'distance_km': element['distance']['value'] / 1000,  # Convert meters to km
+            'duration_minutes': element['duration']['value'] / 60  # Convert seconds to minutes
+        }
+    
+    @staticmethod
+    def _cache_route_element(origin, destination, element):
+        key = route_cache_key(origin, destination, ROUTE_CACHE_CELL_M, ROUTE_CACHE_BUCKET_MINUTES)
+        route_cache.set(key, LocationService._route_metrics(element), ROUTE_CACHE_TTL_SECONDS)
+    
+    @staticmethod
+    def update_driver_location(driver_id, lat, lng, recorded_at=None):
+        """
+        Update driver's current location.
+        The fix is buffered and written to the database in bulk by location_buffer;
+        the driver index sees the new position immediately.
+        """
+        if driver_id not in driver_index:
+            # Not an indexed (available) driver, so confirm the role before buffering
+            driver = User.query.get(driver_id)
+            if not driver or driver.role != 'driver':
+                return False
+            location_buffer.add(driver_id, lat, lng, recorded_at)
+            driver_index.sync_driver(driver)
+            driver_features.record_location(driver_id, recorded_at)
+            return True
         
-        # Sort by distance
-        nearby_drivers.sort(key=lambda x: x['distance_km'])
-        return nearby_drivers
+        location_buffer.add(driver_id, lat, lng, recorded_at)
+        driver_index.update_location(driver_id, lat, lng)
+        driver_features.record_location(driver_id, recorded_at)
+        return True
+    
+    @staticmethod
+    def get_driver_position(driver):
+        """Driver's live (lat, lng, updated_at), preferring an unflushed buffered fix"""
+        buffered = location_buffer.latest(driver.id)
+        if buffered is not None:
+            return buffered
+        return driver.current_lat, driver.current_lng, driver.location_updated_at
+    
+    @staticmethod
+    @replica_reads
+    def find_nearby_drivers(lat, lng, radius_km=10):
+        """Find available drivers within specified radius"""
+        return [
+            LocationService._nearby_driver_result(driver, distance)
+            for distance, driver in driver_index.within_radius(lat, lng, radius_km)
+        ]
+    
+    @staticmethod
+    def find_nearest_drivers(lat, lng, k=5, max_radius_km=None):
+        """Find the k closest available drivers, optionally capped at max_radius_km"""
+        return [
+            LocationService._nearby_driver_result(driver, distance)
+            for distance, driver in driver_index.nearest(lat, lng, k, max_radius_km)
+        ]
+    
+    @staticmethod
+    def _nearby_driver_result(driver, distance):
+        """Shape an indexed driver entry for API responses"""
+        return {
+            'driver_id': driver['driver_id'],
+            'name': driver['name'],
+            'lat': driver['lat'],
+            'lng': driver['lng'],
+            'distance_km': round(distance, 2),
+            'rating': driver['rating'],
+            'total_rides': driver['total_rides'],
+            'vehicle_info': driver['vehicle_info']
+        }
     
     @staticmethod
     def _calculate_haversine_distance(lat1, lng1, lat2, lng2):
         """Calculate distance between two points using Haversine formula"""
-        R = 6371  # Earth's radius in km
-        
-        lat1_rad = math.radians(lat1)
-        lng1_rad = math.radians(lng1)
-        lat2_rad = math.radians(lat2)
-        lng2_rad = math.radians(lng2)
-        
-        dlat = lat2_rad - lat1_rad
-        dlng = lng2_rad - lng1_rad
-        
-        a = (math.sin(dlat/2)**2 + 
-             math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlng/2)**2)
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-        
-        return R * c
+        return haversine_km(lat1, lng1, lat2, lng2)
+    
+    @staticmethod
+    def batch_haversine_distances(lat, lng, lats, lngs):
+        """Distances in km from one point to arrays of N points, as a NumPy array"""
+        return haversine_km_batch(lat, lng, lats, lngs)
+    
+    @staticmethod
+    def haversine_distance_matrix(origin_lats, origin_lngs, dest_lats, dest_lngs):
+        """N x M NumPy matrix of distances in km between origins and destinations"""
+        return haversine_km_matrix(origin_lats, origin_lngs, dest_lats, dest_lngs)
     
     @staticmethod
     def get_place_autocomplete(input_text, location=None):
@@ -148,8 +270,12 @@ class LocationService:
         api_key = LocationService.get_google_maps_api_key()
         if not api_key:
             return []
+        
+        cached = autocomplete_cache.lookup(input_text, location)
+        if cached is not None:
+            return cached
             
-        url = "https://maps.googleapis.com/maps/api/place/autocomplete/json"
+        url = AUTOCOMPLETE_URL
         params = {
             'input': input_text,
             'key': api_key,
@@ -162,33 +288,43 @@ class LocationService:
             params['radius'] = 50000  # 50km radius
         
         try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data['status'] == 'OK':
-                suggestions = []
-                for prediction in data.get('predictions', []):
-                    suggestions.append({
-                        'place_id': prediction['place_id'],
-                        'description': prediction['description'],
-                        'main_text': prediction['structured_formatting'].get('main_text', ''),
-                        'secondary_text': prediction['structured_formatting'].get('secondary_text', '')
-                    })
-                return suggestions
+            data = google_maps_client.get_json('autocomplete', url, params)
+            return LocationService._autocomplete_result(data, input_text, location)
         except Exception as e:
             print(f"Autocomplete error: {e}")
             
         return []
     
+    @staticmethod
+    def _autocomplete_result(data, input_text, location):
+        """Extract and cache suggestions from a Places Autocomplete response"""
+        if data['status'] == 'OK':
+            suggestions = []
+            for prediction in data.get('predictions', []):
+                suggestions.append({
+                    'place_id': prediction['place_id'],
+                    'description': prediction['description'],
+                    'main_text': prediction['structured_formatting'].get('main_text', ''),
+                    'secondary_text': prediction['structured_formatting'].get('secondary_text', '')
+                })
+            autocomplete_cache.store(input_text, location, suggestions)
+            return suggestions
+        elif data['status'] == 'ZERO_RESULTS':
+            autocomplete_cache.store(input_text, location, [])
+        return []
+    
     @staticmethod
     def get_place_details(place_id):
         """Get detailed information about a place using place_id"""
         api_key = LocationService.get_google_maps_api_key()
         if not api_key:
             return None
+        
+        cached = place_details_cache.get(place_id)
+        if cached is not MISS:
+            return cached
             
-        url = "https://maps.googleapis.com/maps/api/place/details/json"
+        url = PLACE_DETAILS_URL
         params = {
             'place_id': place_id,
             'fields': 'geometry,formatted_address,name',
@@ -196,20 +332,63 @@ class LocationService:
         }
         
         try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data['status'] == 'OK' and 'result' in data:
-                result = data['result']
-                location = result['geometry']['location']
-                return {
-                    'lat': location['lat'],
-                    'lng': location['lng'],
-                    'formatted_address': result.get('formatted_address'),
-                    'name': result.get('name')
-                }
+            data = google_maps_client.get_json('place_details', url, params)
+            return LocationService._place_details_result(data, place_id)
         except Exception as e:
             print(f"Place details error: {e}")
             
-        return None
\ No newline at end of file
+        return None
+    
+    @staticmethod
+    def _place_details_result(data, place_id):
+        """Extract and cache geometry from a Place Details response"""
+        if data['status'] == 'OK' and 'result' in data:
+            result = data['result']
+            location = result['geometry']['location']
+            details = {
+                'lat': location['lat'],
+                'lng': location['lng'],
+                'formatted_address': result.get('formatted_address'),
+                'name': result.get('name')
+            }
+            place_details_cache.set(place_id, details, PLACE_CACHE_TTL_SECONDS)
+            return details
+        return None
+    
+    @staticmethod
+    def warm_place_details_cache(limit=200):
+        """
+        Pre-populate place_details_cache from the most frequent historical
+        pickup and dropoff addresses, with the same Place Details responses
+        /api/place_details would cache. Returns the number of places newly
+        cached; places already cached are skipped.
+        """
+        addresses = union_all(
+            db.select(Ride.pickup_address.label('address')),
+            db.select(Ride.dropoff_address.label('address'))
+        ).subquery()
+        popular = db.session.execute(
+            db.select(addresses.c.address)
+            .group_by(addresses.c.address)
+            .order_by(func.count().desc())
+            .limit(limit)
+        ).scalars().all()
+        
+        warmed = 0
+        for address in popular:
+            result = LocationService.geocode_address(address)
+            if not result or not result.get('place_id'):
+                continue
+            if place_details_cache.get(result['place_id']) is not MISS:
+                continue
+            # get_place_details caches the response itself
+            if LocationService.get_place_details(result['place_id']) is not None:
+                warmed += 1
+        return warmed
+
+
+route_coalescer = DistanceMatrixCoalescer(
+    LocationService.calculate_distance_matrix,
+    ROUTE_CACHE_CELL_M,
+    on_element=LocationService._cache_route_element
+)
@@ -0,0 +1,109 @@
+import os
+import threading
+from collections import deque
+from datetime import datetime
+
+# Most fixes a client may send in one batch
+MAX_BATCH_FIXES = 500
+DEFAULT_PRECISION = 5  # 1e-5 degrees is roughly 1.1 m
+
+
+def encode_fix_batch(fixes, precision=DEFAULT_PRECISION):
+    """
+    Encode (lat, lng, unix_seconds) fixes as the compact batch payload.
+
+    The payload is a flat integer list: the first fix as absolute values
+    scaled by 10**precision, then each following fix as deltas from the
+    previous one, e.g. {"precision": 5, "fixes": [4075050, -7399340,
+    1718550000, 12, -3, 5, ...]}.
+    """
+    scale = 10 ** precision
+    flat = []
+    prev = (0, 0, 0)
+    for lat, lng, ts in fixes:
+        current = (round(lat * scale), round(lng * scale), int(ts))
+        flat.extend(c - p for c, p in zip(current, prev))
+        prev = current
+    return {'precision': precision, 'fixes': flat}
+
+
+def decode_fix_batch(payload):
+    """
+    Decode a compact batch payload into a list of (lat, lng, recorded_at)
+    tuples in recorded order. Raises ValueError for malformed input.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError('Payload must be an object')
+
+    precision = payload.get('precision', DEFAULT_PRECISION)
+    flat = payload.get('fixes')
+    if not isinstance(precision, int) or not 0 <= precision <= 7:
+        raise ValueError('precision must be an integer between 0 and 7')
+    if not isinstance(flat, list) or not flat or len(flat) % 3:
+        raise ValueError('fixes must be a non-empty list of lat, lng, time triples')
+    if len(flat) // 3 > MAX_BATCH_FIXES:
+        raise ValueError(f'At most {MAX_BATCH_FIXES} fixes per batch')
+    if not all(isinstance(v, int) and not isinstance(v, bool) for v in flat):
+        raise ValueError('fixes must contain integers only')
+
+    scale = 10 ** precision
+    fixes = []
+    lat_i = lng_i = ts = 0
+    for i in range(0, len(flat), 3):
+        lat_i += flat[i]
+        lng_i += flat[i + 1]
+        delta_t = flat[i + 2]
+        if i and delta_t < 0:
+            raise ValueError('fixes must be in recorded order')
+        ts += delta_t
+
+        lat, lng = lat_i / scale, lng_i / scale
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise ValueError('Coordinates out of range')
+        try:
+            recorded_at = datetime.fromtimestamp(ts)
+        except (OverflowError, OSError, ValueError):
+            raise ValueError('Invalid fix timestamp')
+        fixes.append((lat, lng, recorded_at))
+
+    return fixes
+
+
+class DriverTraceStore:
+    """
+    Recent GPS trace per driver, kept in memory for trace consumers
+    (route replay, ETA smoothing). Each driver keeps at most `max_fixes`.
+    """
+
+    def __init__(self, max_fixes=None):
+        self.max_fixes = max_fixes or int(os.environ.get('DRIVER_TRACE_MAX_FIXES', 500))
+        self._lock = threading.Lock()
+        self._traces = {}  # driver_id -> deque of (lat, lng, recorded_at)
+
+    def extend(self, driver_id, fixes):
+        """Append fixes, skipping any not newer than the last stored fix"""
+        with self._lock:
+            trace = self._traces.get(driver_id)
+            if trace is None:
+                trace = self._traces[driver_id] = deque(maxlen=self.max_fixes)
+            last_at = trace[-1][2] if trace else None
+            for fix in fixes:
+                if last_at is None or fix[2] > last_at:
+                    trace.append(fix)
+                    last_at = fix[2]
+
+    def recent(self, driver_id, since=None):
+        """Stored fixes for a driver, oldest first, optionally only those after `since`"""
+        with self._lock:
+            trace = list(self._traces.get(driver_id, ()))
+        if since is not None:
+            trace = [fix for fix in trace if fix[2] > since]
+        return trace
+
+    def discard(self, driver_id):
+        with self._lock:
+            self._traces.pop(driver_id, None)
+
+
+# Shared by every request in this process
+trace_store = DriverTraceStore()
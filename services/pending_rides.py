@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+from datetime import datetime
+import numpy as np
+from sqlalchemy.orm import load_only
+from models import Ride
+from services.geo import haversine_km_batch
+
+# Ride columns kept in the feed: what the driver dashboard shows, plus the pickup point
+SNAPSHOT_COLUMNS = (Ride.pickup_address, Ride.dropoff_address, Ride.pickup_lat, Ride.pickup_lng,
+                    Ride.distance_km, Ride.price, Ride.requested_at)
+
+
+class PendingRideFeed:
+    """
+    Process-wide in-memory set of pending, unassigned rides for driver feeds.
+
+    Every driver dashboard load asks for the rides nearest to that driver;
+    serving those from memory keeps a crowd of polling drivers off the
+    database. The ride write paths add rides when they are created and
+    remove them when they are assigned, accepted or cancelled. Rides created
+    or taken through other workers show up when the feed is rebuilt every
+    `refresh_seconds`; a stale entry only costs the driver a lost claim,
+    since accepting is a conditional update.
+    """
+
+    def __init__(self, refresh_seconds=None, max_rides=5000):
+        if refresh_seconds is None:
+            refresh_seconds = float(os.environ.get('PENDING_FEED_REFRESH_SECONDS', 10))
+        self.refresh_seconds = refresh_seconds
+        self.max_rides = max_rides
+
+        self._lock = threading.RLock()
+        self._reload_lock = threading.Lock()
+        self._rides = {}  # ride_id -> snapshot dict
+        self._columns = None  # (snapshots, lats, lngs) cached for queries until the next change
+        self._loaded_at = None
+
+    def ensure_fresh(self):
+        """Reload if empty or older than refresh_seconds; concurrent callers keep serving the old set"""
+        loaded_at = self._loaded_at
+        if loaded_at is not None and time.monotonic() - loaded_at < self.refresh_seconds:
+            return
+        if not self._reload_lock.acquire(blocking=loaded_at is None):
+            return
+        try:
+            self.reload()
+        finally:
+            self._reload_lock.release()
+
+    def reload(self):
+        """Rebuild from the oldest max_rides pending, unassigned rides"""
+        rides = Ride.query.options(load_only(*SNAPSHOT_COLUMNS)).filter(
+            Ride.status == 'pending',
+            Ride.driver_id.is_(None)
+        ).order_by(Ride.requested_at).limit(self.max_rides).all()
+        snapshots = {ride.id: self._snapshot(ride) for ride in rides}
+        with self._lock:
+            self._rides = snapshots
+            self._columns = None
+            self._loaded_at = time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._rides = {}
+            self._columns = None
+            self._loaded_at = None
+
+    def add(self, ride):
+        with self._lock:
+            self._rides[ride.id] = self._snapshot(ride)
+            self._columns = None
+
+    def remove(self, ride_id):
+        with self._lock:
+            if self._rides.pop(ride_id, None) is not None:
+                self._columns = None
+
+    def __contains__(self, ride_id):
+        return ride_id in self._rides
+
+    def __len__(self):
+        return len(self._rides)
+
+    def nearest(self, lat, lng, limit=10):
+        """
+        Up to `limit` pending rides as snapshot dicts, nearest pickup first,
+        each with 'pickup_distance_km'. Rides without pickup coordinates come
+        after located ones, and without a driver position the feed is oldest
+        first.
+        """
+        self.ensure_fresh()
+        snapshots, lats, lngs = self._snapshot_columns()
+        if not snapshots or limit <= 0:
+            return []
+
+        if lat is None or lng is None:
+            order = np.arange(len(snapshots))[:limit]
+            distances = np.full(len(snapshots), np.nan)
+        else:
+            # NaN pickups sort last; argpartition keeps the sort to the rows returned
+            distances = haversine_km_batch(lat, lng, lats, lngs)
+            keys = np.where(np.isnan(distances), np.inf, distances)
+            if limit < len(keys):
+                top = np.argpartition(keys, limit - 1)[:limit]
+                order = top[np.lexsort((top, keys[top]))]
+            else:
+                order = np.lexsort((np.arange(len(keys)), keys))
+
+        results = []
+        for i in order:
+            entry = dict(snapshots[i])
+            entry['pickup_distance_km'] = None if np.isnan(distances[i]) else round(float(distances[i]), 1)
+            results.append(entry)
+        return results
+
+    def _snapshot_columns(self):
+        with self._lock:
+            if self._columns is None:
+                # Oldest first, so ties in distance and the no-location feed favour waiting riders
+                snapshots = sorted(self._rides.values(), key=lambda s: (s['requested_at'] or datetime.max, s['id']))
+                lats = np.array([s['pickup_lat'] for s in snapshots], dtype=np.float64)
+                lngs = np.array([s['pickup_lng'] for s in snapshots], dtype=np.float64)
+                self._columns = (snapshots, lats, lngs)
+            return self._columns
+
+    @staticmethod
+    def _snapshot(ride):
+        return {
+            'id': ride.id,
+            'pickup_address': ride.pickup_address,
+            'dropoff_address': ride.dropoff_address,
+            'pickup_lat': ride.pickup_lat,
+            'pickup_lng': ride.pickup_lng,
+            'distance_km': ride.distance_km,
+            'price': ride.price,
+            'requested_at': ride.requested_at
+        }
+
+
+# Shared by every request in this process
+pending_rides = PendingRideFeed()
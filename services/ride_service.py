@@ -1,16 +1,41 @@
 from app import db
-from models import Ride, User
+from replica import replica_reads
+from models import DriverStats, Ride, User
 from services.pricing_service import calculate_ride_price
+from services.dispatch_queue import dispatch_queue
+from services.dispatch_service import batch_dispatcher
+from services.driver_features import driver_features
+from services.driver_index import driver_index
+from services.pending_rides import pending_rides
 import random
 from datetime import datetime
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import joinedload, selectinload
+
+# Drivers tried per assignment when claims keep losing races to other bookings
+CLAIM_ATTEMPTS = 3
+
+RIDE_HISTORY_PAGE_SIZE = 20
+_CURSOR_TIME_FORMAT = '%Y%m%dT%H%M%S%f'
+
+# User columns shown for the other party of a ride in lists and receipts
+PERSON_COLUMNS = (User.first_name, User.last_name, User.profile_image_url, User.rating)
+
+
+def _person(relationship):
+    """Load a ride's rider or driver in the same query, with only PERSON_COLUMNS"""
+    return joinedload(relationship).load_only(*PERSON_COLUMNS)
 
 class RideService:
     @staticmethod
-    def create_ride(rider_id, pickup_address, dropoff_address, pickup_coords=None, dropoff_coords=None, notes=None):
+    def create_ride(rider_id, pickup_address, dropoff_address, pickup_coords=None, dropoff_coords=None, notes=None,
+                    distance_km=None, estimated_duration=None):
         """Create a new ride request"""
-        # Mock distance calculation (in real app, use Google Maps API)
-        distance_km = RideService._calculate_mock_distance(pickup_coords, dropoff_coords)
-        estimated_duration = max(15, int(distance_km * 2.5))  # Mock estimation
+        if distance_km is None:
+            # Mock distance calculation when no routed distance is available
+            distance_km = RideService._calculate_mock_distance(pickup_coords, dropoff_coords)
+        if estimated_duration is None:
+            estimated_duration = max(15, int(distance_km * 2.5))  # Mock estimation
         
         # Calculate price
         price = calculate_ride_price(distance_km, estimated_duration)
@@ -31,9 +56,16 @@ class RideService:
         
         db.session.add(ride)
         db.session.commit()
+        pending_rides.add(ride)
         
-        # Try to assign a driver
-        RideService.assign_driver(ride.id)
+        # Try to assign a driver, unless the batch dispatcher will pick the ride up
+        if batch_dispatcher.enabled:
+            pass
+        elif dispatch_queue.running:
+            # Matching happens on a dispatch worker; the rider sees the result on the ride page
+            dispatch_queue.submit(ride.id)
+        else:
+            RideService.assign_driver(ride.id)
         
         return ride
     
@@ -44,26 +76,80 @@ class RideService:
         if not ride or ride.driver_id:
             return False
         
-        # Find available drivers
-        available_drivers = User.query.filter_by(
-            role='driver',
-            is_available=True
-        ).all()
-        
-        if available_drivers:
+        # Claim a driver with a conditional update, so concurrent bookings can never share one
+        for _ in range(CLAIM_ATTEMPTS):
             # Simple assignment - pick random driver (in real app, use location-based matching)
-            driver = random.choice(available_drivers)
-            ride.driver_id = driver.id
-            ride.status = 'accepted'
-            ride.accepted_at = datetime.now()
-            
-            # Mark driver as busy
-            driver.is_available = False
+            candidates = db.session.query(User.id).filter_by(role='driver', is_available=True)
+            if db.engine.dialect.name == 'postgresql':
+                # Skip drivers another transaction is claiming instead of queueing behind its lock
+                candidates = candidates.with_for_update(skip_locked=True)
+            driver_id = candidates.order_by(func.random()).limit(1).scalar()
+            if driver_id is None:
+                db.session.rollback()
+                return False
             
-            db.session.commit()
-            return True
+            claimed = User.query.filter(
+                User.id == driver_id,
+                User.is_available.is_(True)
+            ).update({User.is_available: False}, synchronize_session=False)
+            if claimed:
+                break
+            db.session.rollback()
+        else:
+            return False
         
-        return False
+        # The ride may have been accepted meanwhile; rolling back releases the driver again
+        if not RideService._claim_ride(ride_id, driver_id):
+            db.session.rollback()
+            return False
+        
+        db.session.commit()
+        pending_rides.remove(ride_id)
+        driver_index.remove(driver_id)
+        driver_features.set_available(driver_id, False)
+        return True
+    
+    @staticmethod
+    def accept_ride(ride_id, driver_id):
+        """
+        Let a driver take a pending ride. Returns False if the ride was taken
+        first, or if the driver is not available (offline, already on a ride,
+        or just claimed by assign_driver or the batch dispatcher).
+        """
+        # Claim the driver like assign_driver does, so one driver can never hold two rides
+        claimed = User.query.filter(
+            User.id == driver_id,
+            User.is_available.is_(True)
+        ).update({User.is_available: False}, synchronize_session=False)
+        if not claimed:
+            db.session.rollback()
+            return False
+        
+        # The ride may have gone meanwhile; rolling back releases the driver again
+        if not RideService._claim_ride(ride_id, driver_id):
+            db.session.rollback()
+            # Taken through another worker; stop offering it here
+            pending_rides.remove(ride_id)
+            return False
+        
+        db.session.commit()
+        pending_rides.remove(ride_id)
+        driver_index.remove(driver_id)
+        driver_features.set_available(driver_id, False)
+        return True
+    
+    @staticmethod
+    def _claim_ride(ride_id, driver_id):
+        """Set the ride's driver only if it is still pending and unassigned"""
+        return Ride.query.filter(
+            Ride.id == ride_id,
+            Ride.driver_id.is_(None),
+            Ride.status == 'pending'
+        ).update({
+            Ride.driver_id: driver_id,
+            Ride.status: 'accepted',
+            Ride.accepted_at: datetime.now()
+        }, synchronize_session=False) == 1
     
     @staticmethod
     def update_ride_status(ride_id, status, user_id=None):
@@ -76,8 +162,19 @@ class RideService:
         if user_id and user_id not in [ride.rider_id, ride.driver_id]:
             return False
         
+        previous_status = ride.status
         ride.status = status
         
+        # An assigned ride's offer resolves when the driver starts it or cancels it
+        offer_accepted = None
+        if ride.driver_id and previous_status == 'accepted':
+            if status in ('in_progress', 'completed'):
+                offer_accepted = True
+            elif status == 'cancelled' and user_id == ride.driver_id:
+                offer_accepted = False
+        if offer_accepted is not None:
+            RideService._record_offer_outcome(ride.driver_id, offer_accepted)
+        
         if status == 'in_progress':
             ride.started_at = datetime.now()
         elif status == 'completed':
@@ -94,15 +191,90 @@ class RideService:
                 ride.driver.is_available = True
         
         db.session.commit()
+        if status != 'pending':
+            pending_rides.remove(ride.id)
+        if ride.driver and status in ('completed', 'cancelled'):
+            driver_index.sync_driver(ride.driver)
+            driver_features.sync_driver(ride.driver)
+        if ride.driver_id:
+            if offer_accepted is not None:
+                driver_features.record_offer(ride.driver_id, offer_accepted)
+            if status == 'completed':
+                driver_features.record_completed(ride.driver_id)
         return True
     
     @staticmethod
-    def get_user_rides(user_id, role='rider'):
-        """Get rides for a user"""
+    def _record_offer_outcome(driver_id, accepted):
+        """Count a resolved offer in driver_stats as part of the caller's transaction"""
+        updated = DriverStats.query.filter_by(driver_id=driver_id).update({
+            DriverStats.offers: DriverStats.offers + 1,
+            DriverStats.accepts: DriverStats.accepts + (1 if accepted else 0)
+        }, synchronize_session=False)
+        if not updated:
+            db.session.add(DriverStats(driver_id=driver_id, offers=1, accepts=1 if accepted else 0))
+    
+    @staticmethod
+    def get_user_rides(user_id, role='rider', limit=None):
+        """Get rides for a user, newest first; limit is applied in SQL"""
+        rides, _ = RideService.get_user_rides_page(user_id, role, limit=limit)
+        return rides
+    
+    @staticmethod
+    @replica_reads
+    def get_user_rides_page(user_id, role='rider', limit=RIDE_HISTORY_PAGE_SIZE, cursor=None, with_payments=False):
+        """
+        One page of a user's rides, newest first, and the cursor of the next
+        (older) page or None. Pages are keyset-paginated on (requested_at, id),
+        so any page is an index range scan however deep the history goes.
+        
+        The other party of each ride is joined in, and with_payments loads
+        the rides' payments in one more query, so rendering the page does
+        not lazy-load per ride.
+        """
         if role == 'driver':
-            return Ride.query.filter_by(driver_id=user_id).order_by(Ride.requested_at.desc()).all()
+            owner, other = Ride.driver_id, Ride.rider
         else:
-            return Ride.query.filter_by(rider_id=user_id).order_by(Ride.requested_at.desc()).all()
+            owner, other = Ride.rider_id, Ride.driver
+        query = Ride.query.options(_person(other)).filter(owner == user_id)
+        if with_payments:
+            query = query.options(selectinload(Ride.payment))
+        after = RideService.decode_ride_cursor(cursor) if cursor else None
+        if after:
+            query = query.filter(tuple_(Ride.requested_at, Ride.id) < after)
+        query = query.order_by(Ride.requested_at.desc(), Ride.id.desc())
+        if limit is None:
+            return query.all(), None
+        
+        # One extra row tells whether an older page exists
+        rides = query.limit(limit + 1).all()
+        if len(rides) <= limit:
+            return rides, None
+        rides = rides[:limit]
+        return rides, RideService.encode_ride_cursor(rides[-1])
+    
+    @staticmethod
+    def get_pending_rides(lat=None, lng=None, limit=10):
+        """Unassigned rides nearest to (lat, lng) from the in-memory feed; oldest first without a position"""
+        return pending_rides.nearest(lat, lng, limit)
+    
+    @staticmethod
+    @replica_reads
+    def get_ride_with_people(ride_id):
+        """A ride with its rider and driver loaded in the same query, or None"""
+        return Ride.query.options(_person(Ride.rider), _person(Ride.driver)).filter_by(id=ride_id).first()
+    
+    @staticmethod
+    def encode_ride_cursor(ride):
+        return f"{ride.requested_at.strftime(_CURSOR_TIME_FORMAT)}_{ride.id}"
+    
+    @staticmethod
+    def decode_ride_cursor(cursor):
+        """(requested_at, id) from a cursor, or None if it is malformed"""
+        requested_at, _, ride_id = cursor.rpartition('_')
+        try:
+            return datetime.strptime(requested_at, _CURSOR_TIME_FORMAT), int(ride_id)
+        except ValueError:
+            return None
     
     @staticmethod
     def _calculate_mock_distance(pickup_coords, dropoff_coords):